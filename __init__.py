@@ -28,21 +28,48 @@ bl_info = {
     "category": "Import-Export"}
 
 import bpy
+import concurrent.futures
+import contextlib
+import cProfile
 import enum
+import functools
+import hashlib
+import json
 import logging
 import math
+import numpy as np
 import os
+import pstats
 import re
 import struct
+import subprocess
 import tempfile
+import threading
 import time
 import typing
+import zlib
 import mathutils
 from typing import Optional
 from bpy_extras.io_utils import ExportHelper
 
 log = logging.getLogger(__name__)
 kOutputColumns = 32
+kOutputBlockRows = 1024
+kFloatTokenWidth = 24
+kIntTokenDigits = 19
+kBinaryAlignment = 16
+
+# Array element types: storage format in the .ogexb file, and number of components.
+kArrayFormat = {B"float": ("<f4", 1), B"vec2": ("<f4", 2), B"vec3": ("<f4", 3), B"vec4": ("<f4", 4), B"u16": ("<u2", 1), B"u32": ("<u4", 1)}
+
+# Lookup tables used by the bulk number formatters.
+kPowersOfTen = 10 ** np.arange(20, dtype = np.uint64).astype(np.int64)
+kDigitTable = ((np.arange(10000)[:, None] // np.array([1000, 100, 10, 1])) % 10 + ord("0")).astype(np.uint8).view(np.uint32).ravel()
+kTrailingZeroTable = np.array([0] + [len(str(i)) - len(str(i).rstrip("0")) for i in range(1, 10000)], dtype = np.int64)
+kTrailingZeroTable[0] = 4
+kWriteFlushSize = 1 << 20
+kProfileFunctionCount = 50
+kShortIndexLimit = 1 << 16
 
 kNodeTypeNode = 0
 kNodeTypeBone = 1
@@ -56,6 +83,34 @@ kAnimationBezier = 2
 
 kExportEpsilon = 1.0e-6
 
+# Object properties that make up the local transform.
+kTransformPaths = ("location", "delta_location", "rotation_euler", "delta_rotation_euler", "rotation_quaternion", "delta_rotation_quaternion", "rotation_axis_angle", "scale", "delta_scale")
+
+# Data paths of pose bone F-curves start with this prefix followed by the bone name.
+kBonePathPrefix = "pose.bones[\""
+
+# Texture encode cache, kept in a directory next to the exported file by default.
+kTextureCacheDirectory = ".ogex_texture_cache"
+kTextureManifestSuffix = ".manifest.json"
+
+# Arrays that an animation worker process returns for each action, and how much of the
+# output of a failed worker is printed. A worker that takes longer than the start timeout
+# plus the frame timeout for every frame of every action it samples is stopped.
+kWorkerArrayNames = ("rest", "matrices", "translations", "rotations")
+kWorkerLogLength = 4096
+kWorkerStartTimeout = 300.0
+kWorkerFrameTimeout = 0.5
+
+# Vertex cache optimization (Tom Forsyth, "Linear-Speed Vertex Cache Optimisation").
+# Scores are looked up by position in the simulated LRU cache and by the number of
+# triangles still using a vertex. Statistics are measured with a FIFO cache.
+
+kVertexCacheSize = 32
+kVertexCacheStatisticsSize = 16
+kMaxValenceScore = 64
+kCacheScoreTable = [0.75, 0.75, 0.75] + [(1.0 - (i - 3) / (kVertexCacheSize - 3)) ** 1.5 for i in range(3, kVertexCacheSize)]
+kValenceScoreTable = [0.0] + [2.0 * i ** -0.5 for i in range(1, kMaxValenceScore)]
+
 structIdentifier = [B"node", B"bone_node", B"geometry_node", B"light_node", B"camera_node"]
 
 subtranslationName = [B"xpos", B"ypos", B"zpos"]
@@ -115,45 +170,1103 @@ class ExportVertex:
             return (False)
         return (True)
 
-    # TODO: Why are we rolling our own hash function above? Is it faster/better somehow? Profile it!
-    #def Hash(self):
-    #    h = hash(
-    #        self.position[0],
-    #        self.position[1],
-    #        self.position[2],
-    #        self.normal[0],
-    #        self.normal[1],
-    #        self.normal[2],
-    #        self.tangent[0],
-    #        self.tangent[1],
-    #        self.tangent[2],
-    #        self.color[0],
-    #        self.color[1],
-    #        self.color[2],
-    #        self.texcoord0[0],
-    #        self.texcoord0[1],
-    #        self.texcoord1[0],
-    #        self.texcoord1[1]
-    #    )
-    #    self.hash = h
     def Hash(self):
-        h = hash(self.position[0])
-        h = h * 21737 + hash(self.position[1])
-        h = h * 21737 + hash(self.position[2])
-        h = h * 21737 + hash(self.normal[0])
-        h = h * 21737 + hash(self.normal[1])
-        h = h * 21737 + hash(self.normal[2])
-        h = h * 21737 + hash(self.tangent[0])
-        h = h * 21737 + hash(self.tangent[1])
-        h = h * 21737 + hash(self.tangent[2])
-        h = h * 21737 + hash(self.color[0])
-        h = h * 21737 + hash(self.color[1])
-        h = h * 21737 + hash(self.color[2])
-        h = h * 21737 + hash(self.texcoord0[0])
-        h = h * 21737 + hash(self.texcoord0[1])
-        h = h * 21737 + hash(self.texcoord1[0])
-        h = h * 21737 + hash(self.texcoord1[1])
-        self.hash = h
+        # Tuple hashing mixes every component into a fixed-width machine word, unlike a
+        # running multiply-add that grows into a long integer and leaves the low bits used
+        # to select a bucket dependent on only a few of the components.
+        self.hash = hash((*self.position, *self.normal, *self.tangent, *self.color, *self.texcoord0, *self.texcoord1))
+
+
+class ExportVertexTable:
+    # Struct-of-arrays form of a deindexed mesh. Each array has one row per triangle corner
+    # (or per unified vertex after UnifyVertices), so mesh data can be gathered with
+    # foreach_get and processed with NumPy instead of creating an ExportVertex per corner.
+
+    __slots__ = ("vertexIndex", "faceIndex", "position", "normal", "tangent", "color", "texcoord0", "texcoord1")
+
+    def __init__(self, cornerCount):
+        self.vertexIndex = np.zeros(cornerCount, dtype = np.int32)
+        self.faceIndex = np.zeros(cornerCount, dtype = np.int32)
+        self.position = np.zeros((cornerCount, 3), dtype = np.float32)
+        self.normal = np.zeros((cornerCount, 3), dtype = np.float32)
+        self.tangent = np.zeros((cornerCount, 3), dtype = np.float32)
+        self.color = np.ones((cornerCount, 3), dtype = np.float32)
+        self.texcoord0 = np.zeros((cornerCount, 2), dtype = np.float32)
+        self.texcoord1 = np.zeros((cornerCount, 2), dtype = np.float32)
+
+    def __len__(self):
+        return (len(self.vertexIndex))
+
+    def Select(self, indices):
+        table = ExportVertexTable.__new__(ExportVertexTable)
+        for name in ExportVertexTable.__slots__:
+            setattr(table, name, getattr(self, name)[indices])
+        return (table)
+
+    def Quantize(self, positionTolerance, normalTolerance, tangentTolerance, colorTolerance, texcoordTolerance):
+
+        # This function returns a copy of the table with each attribute snapped to a grid with
+        # the given spacing, so that the vertex unification merges corners whose attributes
+        # round to the same grid points. Corners closer than the tolerance can still fall into
+        # neighboring cells and stay separate. The snapped copy is only used to find the
+        # corners to merge. A tolerance of zero leaves the attribute unchanged.
+
+        table = self.Select(slice(None))
+        for name, tolerance in (("position", positionTolerance), ("normal", normalTolerance), ("tangent", tangentTolerance), ("color", colorTolerance), ("texcoord0", texcoordTolerance), ("texcoord1", texcoordTolerance)):
+            if (tolerance > 0.0):
+                array = getattr(self, name)
+                setattr(table, name, (np.rint(array / tolerance) * tolerance).astype(np.float32))
+
+        return (table)
+
+    def ExportVertices(self):
+        # Builds ExportVertex objects for the hash-based unification.
+        exportVertexArray = []
+        attribs = zip(self.position.tolist(), self.normal.tolist(), self.tangent.tolist(), self.color.tolist(), self.texcoord0.tolist(), self.texcoord1.tolist())
+        for position, normal, tangent, color, texcoord0, texcoord1 in attribs:
+            ev = ExportVertex()
+            ev.position = position
+            ev.normal = normal
+            ev.tangent = tangent
+            ev.color = color
+            ev.texcoord0 = texcoord0
+            ev.texcoord1 = texcoord1
+            ev.Hash()
+            exportVertexArray.append(ev)
+        return (exportVertexArray)
+
+
+class ExportWriter:
+    # All output from the exporter goes through this class. Tokens are accumulated in a
+    # bytearray and handed to the file once the buffer reaches flushSize, so a large mesh
+    # no longer costs one file.write call per number, comma, and tab.
+
+    __slots__ = ("file", "buffer", "flushSize", "indentCache", "flushCount", "byteCount")
+
+    def __init__(self, file, flushSize = kWriteFlushSize):
+        self.file = file
+        self.buffer = bytearray()
+        self.flushSize = flushSize
+        self.indentCache = [B""]
+        self.flushCount = 0
+        self.byteCount = 0
+
+    def Indent(self, level):
+        if (level <= 0):
+            return (B"")
+
+        cache = self.indentCache
+        while (len(cache) <= level):
+            cache.append(B"\t" * len(cache))
+        return (cache[level])
+
+    def Write(self, data):
+        buffer = self.buffer
+        buffer += data
+        if (len(buffer) >= self.flushSize):
+            self.Flush()
+
+    def IndentWrite(self, level, text, newline = False):
+        buffer = self.buffer
+        if (newline):
+            buffer += B"\n"
+        buffer += self.Indent(level)
+        buffer += text
+        if (len(buffer) >= self.flushSize):
+            self.Flush()
+
+    def Flush(self):
+        buffer = self.buffer
+        if (buffer):
+            self.file.write(buffer)
+            self.byteCount += len(buffer)
+            self.flushCount += 1
+            buffer.clear()
+
+    def Close(self):
+        self.Flush()
+        self.file.close()
+
+
+class ExportBinaryFile:
+    # When binary output is enabled, large arrays are written to a sidecar file as packed
+    # little-endian data instead of decimal text. Each array starts on a kBinaryAlignment
+    # boundary so that a loader can map the file and use the arrays in place.
+
+    __slots__ = ("file", "name", "offset")
+
+    def __init__(self, path):
+        self.file = open(path, "wb")
+        self.name = os.path.basename(path)
+        self.offset = 0
+
+    def WriteArray(self, array, format):
+        padding = -self.offset % kBinaryAlignment
+        if (padding != 0):
+            self.file.write(bytes(padding))
+            self.offset += padding
+
+        data = np.ascontiguousarray(array, dtype = format)
+        self.file.write(data.tobytes())
+
+        offset = self.offset
+        self.offset += data.nbytes
+        return (offset, data.nbytes)
+
+    def Close(self):
+        self.file.close()
+
+
+class ExportTextureCache:
+    # Keeps encoded textures in a directory between exports. Each texture is stored under a
+    # fingerprint of everything its encoded bytes depend on (see ExportImage.fingerprint), so
+    # an unchanged texture is read back instead of being encoded again. Every exported file
+    # has its own manifest in the directory, which records the fingerprint of each texture
+    # file that export wrote, and a file that still exists with the size and fingerprint it
+    # was written with is not written again. Cached textures are shared by all the exports
+    # that write to the same folder, and one is only removed when no manifest refers to it.
+
+    __slots__ = ("directory", "manifestPath", "manifest", "previousFingerprints", "usedPaths", "usedFingerprints", "hitCount", "missCount", "skipCount")
+
+    def __init__(self, directory, exportName):
+        self.directory = directory
+        self.manifestPath = os.path.join(directory, exportName + kTextureManifestSuffix)
+        self.manifest = {}
+        self.previousFingerprints = set()
+        self.usedPaths = set()
+        self.usedFingerprints = set()
+        self.hitCount = 0
+        self.missCount = 0
+        self.skipCount = 0
+
+        os.makedirs(directory, exist_ok = True)
+        if (os.path.isfile(self.manifestPath)):
+            try:
+                with open(self.manifestPath, "r") as manifestFile:
+                    self.manifest = json.load(manifestFile)
+            except (OSError, ValueError):
+                self.manifest = {}
+
+        self.previousFingerprints = {entry["fingerprint"] for entry in self.manifest.values()}
+
+    def Unchanged(self, path, fingerprint):
+        entry = self.manifest.get(path)
+        if ((entry) and (entry["fingerprint"] == fingerprint) and (os.path.isfile(path)) and (os.path.getsize(path) == entry["size"])):
+            self.usedPaths.add(path)
+            self.usedFingerprints.add(fingerprint)
+            self.skipCount += 1
+            return (True)
+
+        return (False)
+
+    def Load(self, fingerprint):
+        try:
+            with open(os.path.join(self.directory, fingerprint), "rb") as cacheFile:
+                data = cacheFile.read()
+        except OSError:
+            self.missCount += 1
+            return (None)
+
+        self.hitCount += 1
+        return (data)
+
+    def Store(self, fingerprint, data):
+
+        # Write to a temporary name first so that an interrupted export never leaves a
+        # truncated file under a valid fingerprint.
+
+        path = os.path.join(self.directory, fingerprint)
+        temporaryPath = path + ".tmp"
+        with open(temporaryPath, "wb") as cacheFile:
+            cacheFile.write(data)
+        os.replace(temporaryPath, path)
+
+    def Record(self, path, fingerprint, size):
+        self.manifest[path] = {"fingerprint" : fingerprint, "size" : size}
+        self.usedPaths.add(path)
+        self.usedFingerprints.add(fingerprint)
+
+    def Prune(self):
+
+        # This function removes the manifest entries of texture files that this export didn't
+        # write or check. Cached textures that the previous export of the same file used and
+        # this one didn't are removed unless the manifest of another export still refers to
+        # them. If another manifest can't be read, nothing is removed.
+
+        self.manifest = {path : entry for path, entry in self.manifest.items() if (path in self.usedPaths)}
+
+        unusedFingerprints = self.previousFingerprints - self.usedFingerprints
+        if (not unusedFingerprints):
+            return (0)
+
+        manifestName = os.path.basename(self.manifestPath)
+        for name in os.listdir(self.directory):
+            if ((name.endswith(kTextureManifestSuffix)) and (name != manifestName)):
+                try:
+                    with open(os.path.join(self.directory, name), "r") as manifestFile:
+                        manifest = json.load(manifestFile)
+                    unusedFingerprints -= {entry["fingerprint"] for entry in manifest.values()}
+                except (OSError, ValueError, KeyError, TypeError, AttributeError):
+                    return (0)
+
+        removeCount = 0
+        for fingerprint in unusedFingerprints:
+            for path in (os.path.join(self.directory, fingerprint), os.path.join(self.directory, fingerprint + ".tmp")):
+                try:
+                    os.remove(path)
+                    removeCount += 1
+                except OSError:
+                    pass
+
+        return (removeCount)
+
+    def Close(self):
+        removeCount = self.Prune()
+        temporaryPath = self.manifestPath + ".tmp"
+        with open(temporaryPath, "w") as manifestFile:
+            json.dump(self.manifest, manifestFile, indent = 1, sort_keys = True)
+        os.replace(temporaryPath, self.manifestPath)
+        print(f"Texture cache: {self.skipCount} unchanged, {self.hitCount} reused, {self.missCount} encoded, {removeCount} removed")
+
+
+class ExportFilePool:
+    # Writes files on background threads so that slow disks and network shares don't hold up
+    # the export. File writes release the GIL, so they overlap with the serialization that
+    # goes on in the meantime. At most queueSize writes can be waiting at once, after which
+    # Submit blocks until one finishes, which bounds the memory held by pending data. An
+    # error in a write is raised by the next Submit or by Close, which waits for all writes.
+
+    __slots__ = ("executor", "slots", "futures")
+
+    def __init__(self, threadCount, queueSize):
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers = threadCount, thread_name_prefix = "ogex_write")
+        self.slots = threading.BoundedSemaphore(max(queueSize, 1))
+        self.futures = []
+
+    @staticmethod
+    def WriteFile(path, data):
+        with open(path, "wb") as file:
+            file.write(data)
+
+    def RaiseErrors(self):
+        pendingArray = []
+        for future in self.futures:
+            if (not future.done()):
+                pendingArray.append(future)
+            elif (future.exception()):
+                raise future.exception()
+
+        self.futures = pendingArray
+
+    def Submit(self, function, *args):
+        self.RaiseErrors()
+        self.slots.acquire()
+        try:
+            future = self.executor.submit(function, *args)
+        except BaseException:
+            self.slots.release()
+            raise
+
+        future.add_done_callback(lambda future: self.slots.release())
+        self.futures.append(future)
+
+    def Close(self):
+        try:
+            for future in self.futures:
+                future.result()
+        finally:
+            self.futures = []
+            self.executor.shutdown(wait = True)
+
+    def Cancel(self):
+
+        # This function is called when the export fails. Writes that haven't started yet are
+        # dropped, and it waits for the ones in progress without raising their errors, so that
+        # no thread is left writing after the export has returned.
+
+        for future in self.futures:
+            future.cancel()
+
+        self.futures = []
+        self.executor.shutdown(wait = True)
+
+
+class ExportProfiler:
+    # Collects the time spent in each phase of the export. Sections nest, and each one is
+    # recorded under its path from the outermost section, so the report shows both where time
+    # goes overall and how it splits below each phase. A recursive section (such as ExportNode
+    # calling itself for child nodes) is only timed at its outermost level. Optionally the
+    # whole export also runs under cProfile.
+
+    __slots__ = ("stack", "sections", "profile", "startTime")
+
+    def __init__(self, pythonProfileFlag):
+        self.stack = []
+        self.sections = {}
+        self.profile = cProfile.Profile() if (pythonProfileFlag) else None
+        self.startTime = time.perf_counter()
+        if (self.profile):
+            self.profile.enable()
+
+    @contextlib.contextmanager
+    def Section(self, name):
+        if (name in self.stack):
+            yield
+            return
+
+        self.stack.append(name)
+        path = "/".join(self.stack)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stack.pop()
+            entry = self.sections.get(path)
+            if (entry):
+                entry[0] += 1
+                entry[1] += elapsed
+            else:
+                self.sections[path] = [1, elapsed]
+
+    def Stop(self):
+        if (self.profile):
+            self.profile.disable()
+
+    def Finish(self, reportBasePath):
+
+        # This function stops the profiler, prints the time of each top-level section, and
+        # writes the full report to reportBasePath + ".profile.json" if a path is given. When
+        # cProfile was running, its statistics are saved to reportBasePath + ".prof" and the
+        # functions with the highest cumulative time are included in the report.
+
+        totalTime = time.perf_counter() - self.startTime
+        self.Stop()
+
+        for path, (count, seconds) in self.sections.items():
+            if ("/" not in path):
+                print(f"  {path}: {seconds:.3f} s")
+        print(f"Export took {totalTime:.3f} s")
+
+        if (not reportBasePath):
+            return
+
+        report = {"total_seconds": totalTime, "sections": [{"path": path, "count": count, "seconds": seconds} for path, (count, seconds) in self.sections.items()]}
+
+        if (self.profile):
+            profilePath = reportBasePath + ".prof"
+            self.profile.dump_stats(profilePath)
+            stats = pstats.Stats(self.profile)
+            functionArray = []
+            for function, (primitiveCalls, callCount, ownTime, cumulativeTime, callers) in stats.stats.items():
+                functionArray.append({"function": f"{function[0]}:{function[1]}({function[2]})", "calls": callCount, "total_seconds": ownTime, "cumulative_seconds": cumulativeTime})
+            functionArray.sort(key = lambda f: f["cumulative_seconds"], reverse = True)
+            report["profile_file"] = os.path.basename(profilePath)
+            report["functions"] = functionArray[0:kProfileFunctionCount]
+
+        with open(reportBasePath + ".profile.json", "w") as file:
+            json.dump(report, file, indent = 1)
+
+
+def ProfiledSection(function):
+    # Times every call of an exporter method as a section named after the method.
+
+    name = function.__name__
+
+    @functools.wraps(function)
+    def wrapper(self, *args, **kwargs):
+        with self.profiler.Section(name):
+            return (function(self, *args, **kwargs))
+
+    return (wrapper)
+
+
+class KeyframeTable:
+    # Holds the keyframes of an F-curve as arrays with one row per key, read with foreach_get
+    # in a single pass per attribute. The columns of co and the handles are time and value.
+    # The interpolation modes are kept as a set because only their combination matters.
+
+    __slots__ = ("co", "handleLeft", "handleRight", "interpolation")
+
+    def __init__(self, fcurve):
+        keyframePoints = fcurve.keyframe_points
+        self.co = OpenGexExporter.GatherArray(keyframePoints, "co", 2).astype(np.float64)
+        self.handleLeft = OpenGexExporter.GatherArray(keyframePoints, "handle_left", 2).astype(np.float64)
+        self.handleRight = OpenGexExporter.GatherArray(keyframePoints, "handle_right", 2).astype(np.float64)
+        self.interpolation = {key.interpolation for key in keyframePoints}
+
+
+class ActionIndex:
+    # Maps each bone name to the actions that have F-curves for that bone, and the data paths
+    # in each action to their F-curves. The index is built once per export, so the bones and
+    # objects being exported don't each have to search every action in the file.
+
+    __slots__ = ("boneActions", "actionCurves")
+
+    def __init__(self, actions):
+        self.boneActions = {}
+        self.actionCurves = {}
+
+        for action in actions:
+            curveTable = {}
+            for fcurve in action.fcurves:
+                curveTable.setdefault(fcurve.data_path, []).append(fcurve)
+            self.actionCurves[action] = curveTable
+
+            boneNames = set()
+            for path in curveTable:
+                if (path.startswith(kBonePathPrefix)):
+                    end = path.find("\"].", len(kBonePathPrefix))
+                    if (end >= 0):
+                        boneNames.add(path[len(kBonePathPrefix):end])
+
+            for boneName in boneNames:
+                self.boneActions.setdefault(boneName, []).append(action.name)
+
+    def BoneActions(self, boneName):
+
+        # This function returns the names of the actions that animate a bone, in the order
+        # in which they appear in the file.
+
+        return (self.boneActions.get(boneName, []))
+
+    def Curves(self, action, path):
+        curveTable = self.actionCurves.get(action)
+        if (curveTable is None):
+            return ([fcurve for fcurve in action.fcurves if (fcurve.data_path == path)])
+
+        return (curveTable.get(path, []))
+
+
+class SamplingIsolation:
+    # Keeps frame_set from evaluating parts of the scene that sampled animation doesn't depend
+    # on. The dependency closure of the sampled objects is found by following parents,
+    # constraint and modifier targets, and driver variables. Objects outside the closure are
+    # disabled in viewports. Modifiers are also disabled on sampled objects whose geometry no
+    # other object in the closure refers to, since their transforms, poses, and shape key
+    # weights don't depend on it. Everything that was changed is restored on exit.
+
+    __slots__ = ("objects", "objectState", "modifierState")
+
+    def __init__(self, objects):
+        self.objects = objects
+        self.objectState = []
+        self.modifierState = []
+
+    @staticmethod
+    def ReferencedObjects(struct):
+
+        # This function finds the objects that a constraint or modifier points to, including
+        # collections of targets and objects passed to geometry node inputs.
+
+        for property in struct.bl_rna.properties:
+            if (property.type == "POINTER"):
+                value = getattr(struct, property.identifier)
+                if (isinstance(value, bpy.types.Object)):
+                    yield value
+            elif (property.type == "COLLECTION"):
+                for item in getattr(struct, property.identifier):
+                    target = getattr(item, "target", None)
+                    if (isinstance(target, bpy.types.Object)):
+                        yield target
+
+        if (struct.type == "NODES"):
+            for key in struct.keys():
+                value = struct[key]
+                if (isinstance(value, bpy.types.Object)):
+                    yield value
+
+    @staticmethod
+    def Dependencies(node):
+        if (node.parent):
+            yield node.parent
+
+        constraintArray = list(node.constraints)
+        if (node.pose):
+            for poseBone in node.pose.bones:
+                constraintArray.extend(poseBone.constraints)
+
+        for constraint in constraintArray:
+            yield from SamplingIsolation.ReferencedObjects(constraint)
+        for modifier in node.modifiers:
+            yield from SamplingIsolation.ReferencedObjects(modifier)
+
+        shapeKeys = OpenGexExporter.GetShapeKeys(node.data) if (hasattr(node.data, "shape_keys")) else None
+        for animationData in (node.animation_data, getattr(node.data, "animation_data", None), shapeKeys.animation_data if (shapeKeys) else None):
+            if (animationData):
+                for fcurve in animationData.drivers:
+                    for variable in fcurve.driver.variables:
+                        for target in variable.targets:
+                            if (isinstance(target.id, bpy.types.Object)):
+                                yield target.id
+
+    @staticmethod
+    def Closure(objects):
+
+        # This function returns the objects that the given objects depend on, directly or
+        # indirectly, together with the objects themselves, and the set of objects that some
+        # object in the closure refers to.
+
+        closure = set(objects)
+        referenced = set()
+        stack = list(objects)
+        while (len(stack) != 0):
+            for dependency in SamplingIsolation.Dependencies(stack.pop()):
+                referenced.add(dependency)
+                if (dependency not in closure):
+                    closure.add(dependency)
+                    stack.append(dependency)
+
+        return (closure, referenced)
+
+    def __enter__(self):
+        closure, referenced = SamplingIsolation.Closure(self.objects)
+
+        # Linked objects can't be changed, so they are left alone. If changing anything else
+        # fails, what was already changed is restored before the error is passed on, since
+        # __exit__ isn't called when __enter__ raises.
+
+        try:
+            for node in bpy.data.objects:
+                if (node.library):
+                    continue
+
+                if (node not in closure):
+                    if (not node.hide_viewport):
+                        node.hide_viewport = True
+                        self.objectState.append(node)
+                elif (node not in referenced):
+                    for modifier in node.modifiers:
+                        if (modifier.show_viewport):
+                            modifier.show_viewport = False
+                            self.modifierState.append(modifier)
+        except BaseException:
+            self.__exit__(None, None, None)
+            raise
+
+        print(f"Isolated sampling: disabled {len(self.objectState)} objects and {len(self.modifierState)} modifiers")
+        return (self)
+
+    def __exit__(self, excType, excValue, traceback):
+        for modifier in self.modifierState:
+            modifier.show_viewport = True
+        for node in self.objectState:
+            node.hide_viewport = False
+
+        if ((len(self.objectState) != 0) or (len(self.modifierState) != 0)):
+            bpy.context.view_layer.update()
+
+        return (False)
+
+
+class AnimationSampler:
+    # Samples everything the exporter writes as per-frame animation in as few timeline sweeps
+    # as possible. One sweep over the frame range captures the local matrix of every exported
+    # node and the weight of every shape key. Bone animation is stored per action, so each
+    # action that animates an exported bone is assigned to its armature and swept once, and
+    # all of the bones it animates are captured together. The armature's original action and
+    # the current frame are restored afterwards. The writers then read the captured samples
+    # instead of calling frame_set themselves.
+    #
+    # Nodes and shape keys whose values come only from their own F-curves (no constraints,
+    # drivers, NLA tracks, or parents other than plain objects) don't need the timeline at
+    # all. Their F-curves are evaluated directly and the local transform is composed the same
+    # way Blender does it. If every node and shape key qualifies, the shared sweep is skipped.
+
+    __slots__ = ("nodeSamples", "morphSamples", "boneSamples", "sweepCount", "directFlag", "isolateFlag", "workerCount", "actionIndex")
+
+    def __init__(self, directFlag, isolateFlag, workerCount, actionIndex):
+        self.nodeSamples = {}
+        self.morphSamples = {}
+        self.boneSamples = {}
+        self.sweepCount = 0
+        self.directFlag = directFlag
+        self.isolateFlag = isolateFlag
+        self.workerCount = workerCount
+        self.actionIndex = actionIndex
+
+    @staticmethod
+    def DirectAnimationData(animationData):
+        return ((not animationData) or ((len(animationData.drivers) == 0) and (len(animationData.nla_tracks) == 0)))
+
+    @staticmethod
+    def DirectNode(node):
+
+        # This function determines whether the local transform of a node depends only on
+        # its own F-curves, so that it can be computed without evaluating the scene.
+
+        if ((len(node.constraints) != 0) or (node.rigid_body)):
+            return (False)
+
+        parent = node.parent
+        if ((parent) and ((node.parent_type != "OBJECT") or (parent.type == "CURVE"))):
+            return (False)
+
+        return (AnimationSampler.DirectAnimationData(node.animation_data))
+
+    @staticmethod
+    def DirectShapeKeys(node, shapeKeys):
+        if (not AnimationSampler.DirectAnimationData(shapeKeys.animation_data)):
+            return (False)
+
+        # The exporter also accepts shape key curves stored in the object's action.
+
+        animationData = node.animation_data
+        if ((animationData) and (animationData.action)):
+            for fcurve in animationData.action.fcurves:
+                if (fcurve.data_path.startswith("data.shape_keys.")):
+                    return (False)
+
+        return (True)
+
+    @staticmethod
+    def ComposeLocalMatrix(node, values):
+
+        # This function builds the local transform from location, rotation, and scale in the
+        # same way as Blender: the delta rotation is applied after the rotation, and the
+        # result is location @ rotation @ scale, preceded by the parent inverse matrix.
+
+        mode = node.rotation_mode
+        if (mode == "QUATERNION"):
+            rotation = mathutils.Quaternion(values["delta_rotation_quaternion"]).normalized().to_matrix() @ mathutils.Quaternion(values["rotation_quaternion"]).normalized().to_matrix()
+        elif (mode == "AXIS_ANGLE"):
+            axisAngle = values["rotation_axis_angle"]
+            rotation = mathutils.Matrix.Rotation(axisAngle[0], 3, mathutils.Vector(axisAngle[1:4]))
+        else:
+            rotation = mathutils.Euler(values["delta_rotation_euler"], mode).to_matrix() @ mathutils.Euler(values["rotation_euler"], mode).to_matrix()
+
+        location = mathutils.Vector(values["location"]) + mathutils.Vector(values["delta_location"])
+        scale = [values["scale"][i] * values["delta_scale"][i] for i in range(3)]
+
+        matrix = mathutils.Matrix.Translation(location) @ rotation.to_4x4() @ mathutils.Matrix.Diagonal(scale).to_4x4()
+        if (node.parent):
+            matrix = node.matrix_parent_inverse @ matrix
+        return (matrix)
+
+    @staticmethod
+    def EvaluateNode(node, frameRange, actionIndex):
+
+        # This function computes the local transform of a node for each frame directly from
+        # its F-curves. Components without a curve keep their current values.
+
+        values = {path: list(getattr(node, path)) for path in kTransformPaths}
+        curveArray = []
+        animationData = node.animation_data
+        if ((animationData) and (animationData.action)):
+            for path, components in values.items():
+                found = set()
+                for fcurve in actionIndex.Curves(animationData.action, path):
+                    if ((fcurve.array_index not in found) and (not fcurve.mute)):
+                        found.add(fcurve.array_index)
+                        curveArray.append((components, fcurve.array_index, fcurve))
+
+        if (len(curveArray) == 0):
+            matrix = node.matrix_local.copy()
+            return ([matrix] * len(frameRange))
+
+        matrices = []
+        for i in frameRange:
+            for components, index, fcurve in curveArray:
+                components[index] = fcurve.evaluate(i)
+            matrices.append(AnimationSampler.ComposeLocalMatrix(node, values))
+
+        return (matrices)
+
+    @staticmethod
+    def EvaluateShapeKey(shapeKeys, block, frameRange, actionIndex):
+
+        # This function computes the weight of a shape key for each frame directly from its
+        # F-curve, clamped to the slider range like a value set by the animation system.
+
+        animationData = shapeKeys.animation_data
+        if ((animationData) and (animationData.action)):
+            for fcurve in actionIndex.Curves(animationData.action, block.path_from_id("value")):
+                if (not fcurve.mute):
+                    low = block.slider_min
+                    high = block.slider_max
+                    return ([min(max(fcurve.evaluate(i), low), high) for i in frameRange])
+
+        return ([block.value] * len(frameRange))
+
+    def Sample(self, exporter, scene):
+        currentFrame = scene.frame_current
+        currentSubframe = scene.frame_subframe
+        frameRange = range(exporter.beginFrame, exporter.endFrame + 1)
+
+        nodeArray = []
+        blockArray = []
+        armatureArray = []
+        sweepArray = []
+
+        for node, nodeRef in exporter.nodeArray.items():
+            if (not isinstance(node, bpy.types.Object)):
+                continue
+
+            if ((self.directFlag) and (AnimationSampler.DirectNode(node))):
+                self.nodeSamples[node] = (node.matrix_local.copy(), AnimationSampler.EvaluateNode(node, frameRange, self.actionIndex))
+            else:
+                nodeArray.append(node)
+
+            if (nodeRef["nodeType"] == kNodeTypeGeometry):
+                shapeKeys = OpenGexExporter.GetShapeKeys(node.data)
+                if (shapeKeys):
+                    if ((self.directFlag) and (AnimationSampler.DirectShapeKeys(node, shapeKeys))):
+                        for block in shapeKeys.key_blocks:
+                            self.morphSamples[block] = AnimationSampler.EvaluateShapeKey(shapeKeys, block, frameRange, self.actionIndex)
+                    else:
+                        blockArray.extend(shapeKeys.key_blocks)
+                        sweepArray.append(node)
+            if ((node.type == "ARMATURE") and (node.data) and (node.animation_data)):
+                armatureArray.append(node)
+
+        sweepArray.extend(nodeArray)
+        sweepArray.extend(armatureArray)
+
+        jobArray = []
+        for armature in armatureArray:
+            jobArray.extend(self.CollectBoneJobs(exporter, armature))
+
+        # Workers sample the bone actions while this process sweeps the nodes and shape keys.
+
+        workers = None
+        if (AnimationWorkers.Available(self.workerCount, jobArray)):
+            workers = AnimationWorkers(scene, jobArray, self.workerCount, frameRange, currentFrame, currentSubframe, self.isolateFlag)
+
+        isolation = contextlib.nullcontext()
+        if ((self.isolateFlag) and (len(sweepArray) != 0)):
+            isolation = SamplingIsolation(sweepArray)
+
+        try:
+            with isolation:
+                self.SampleNodes(scene, nodeArray, blockArray, frameRange, currentFrame, currentSubframe)
+                if (workers):
+                    jobArray = workers.Collect(self)
+                self.SampleBones(scene, jobArray, frameRange, currentFrame, currentSubframe)
+        finally:
+            if (workers):
+                workers.Close()
+
+        print(f"Sampled animation in {self.sweepCount} sweeps of {len(frameRange)} frames")
+
+    def SampleNodes(self, scene, nodeArray, blockArray, frameRange, currentFrame, currentSubframe):
+
+        # Sweep once for all node transforms and shape key weights. The samples taken after
+        # returning to the current frame are the rest values used to detect animation.
+
+        if ((len(nodeArray) != 0) or (len(blockArray) != 0)):
+            nodeMatrices = [[] for node in nodeArray]
+            blockValues = [[] for block in blockArray]
+            self.sweepCount += 1
+            for i in frameRange:
+                scene.frame_set(i)
+                for node, matrices in zip(nodeArray, nodeMatrices):
+                    matrices.append(node.matrix_local.copy())
+                for block, values in zip(blockArray, blockValues):
+                    values.append(block.value)
+
+            scene.frame_set(currentFrame, subframe=currentSubframe)
+            for node, matrices in zip(nodeArray, nodeMatrices):
+                self.nodeSamples[node] = (node.matrix_local.copy(), matrices)
+            for block, values in zip(blockArray, blockValues):
+                self.morphSamples[block] = values
+
+    @staticmethod
+    def GatherPoseMatrices(poseBones, poseBuffer):
+
+        # This function reads the armature space matrix of every pose bone with foreach_get.
+        # Matrices come out of Blender column by column, so they are transposed to rows.
+
+        poseBones.foreach_get("matrix", poseBuffer)
+        return (poseBuffer.reshape(-1, 4, 4).transpose(0, 2, 1).astype(np.float64))
+
+    @staticmethod
+    def InvertMatrices(matrices):
+
+        # This function inverts an array of matrices. Singular matrices, which would make
+        # Matrix.inverted_safe perturb the diagonal, get their pseudo-inverse instead.
+
+        inverse = np.empty_like(matrices)
+        regular = np.abs(np.linalg.det(matrices)) > kExportEpsilon
+        inverse[regular] = np.linalg.inv(matrices[regular])
+        if (not np.all(regular)):
+            inverse[~regular] = np.linalg.pinv(matrices[~regular])
+        return (inverse)
+
+    @staticmethod
+    def MatrixToQuaternion(matrices):
+
+        # This function converts an array of matrices to unit quaternions in (w, x, y, z)
+        # order like Matrix.to_quaternion. The columns of the rotation part are normalized to
+        # remove scale, and each quaternion is computed from whichever of its components has
+        # the largest magnitude so that the division is well conditioned. The result has w >= 0.
+
+        rotation = matrices[..., :3, :3]
+        rotation = rotation / np.maximum(np.linalg.norm(rotation, axis = -2, keepdims = True), kExportEpsilon)
+        m = [[rotation[..., row, column] for column in range(3)] for row in range(3)]
+
+        trace = m[0][0] + m[1][1] + m[2][2]
+        square = np.stack((1.0 + trace, 1.0 + 2.0 * m[0][0] - trace, 1.0 + 2.0 * m[1][1] - trace, 1.0 + 2.0 * m[2][2] - trace))
+        largest = np.argmax(square, axis = 0)
+        s = np.sqrt(np.maximum(np.take_along_axis(square, largest[None], axis = 0)[0], kExportEpsilon)) * 2.0
+
+        wx = m[2][1] - m[1][2]
+        wy = m[0][2] - m[2][0]
+        wz = m[1][0] - m[0][1]
+        xy = m[0][1] + m[1][0]
+        xz = m[0][2] + m[2][0]
+        yz = m[1][2] + m[2][1]
+
+        candidates = np.stack((
+            np.stack((s * 0.25, wx / s, wy / s, wz / s), axis = -1),
+            np.stack((wx / s, s * 0.25, xy / s, xz / s), axis = -1),
+            np.stack((wy / s, xy / s, s * 0.25, yz / s), axis = -1),
+            np.stack((wz / s, xz / s, yz / s, s * 0.25), axis = -1)))
+        quaternions = np.take_along_axis(candidates, largest[None, ..., None], axis = 0)[0]
+        quaternions /= np.linalg.norm(quaternions, axis = -1, keepdims = True)
+        quaternions[quaternions[..., 0] < 0.0] *= -1.0
+        return (quaternions)
+
+    def CollectBoneJobs(self, exporter, armature):
+
+        # This function groups the exported bones of an armature by the actions that animate
+        # them. Each action becomes one job that is sampled in a single sweep.
+
+        actionBones = {}
+        for bone in armature.data.bones:
+            if (bone in exporter.nodeArray):
+                if (armature.pose.bones.get(bone.name)):
+                    for action in self.actionIndex.BoneActions(bone.name):
+                        actionBones.setdefault(action, []).append(bone.name)
+
+        return ([(armature, action, boneNames) for action, boneNames in actionBones.items()])
+
+    @staticmethod
+    def SampleAction(scene, armature, action, boneNames, frameRange, currentFrame, currentSubframe):
+
+        # This function assigns an action to an armature and samples the given bones over the
+        # frame range. It returns the rest matrices, the armature space matrices, and the
+        # local translations and rotations, indexed by frame and then by bone.
+
+        # Pose matrices are read for the whole skeleton at once. PoseBone.matrix is in
+        # armature space, so the local transform of each bone only needs the inverse of its
+        # parent's matrix from the same frame, and all bones can be converted together.
+
+        poseBones = armature.pose.bones
+        boneIndex = {poseBone.name: index for index, poseBone in enumerate(poseBones)}
+        parentIndex = np.array([boneIndex[poseBone.parent.name] if (poseBone.parent) else -1 for poseBone in poseBones], dtype = np.int32)
+        poseBuffer = np.empty(len(poseBones) * 16, dtype = np.float32)
+
+        armature.animation_data.action = bpy.data.actions.get(action)
+
+        selection = np.array([boneIndex[boneName] for boneName in boneNames], dtype = np.int32)
+        boneMatrices = np.empty((len(frameRange), len(selection), 4, 4))
+        parentMatrices = np.empty((len(frameRange), len(selection), 4, 4))
+        for frame, i in enumerate(frameRange):
+            scene.frame_set(i)
+            poseMatrices = AnimationSampler.GatherPoseMatrices(poseBones, poseBuffer)
+            boneMatrices[frame] = poseMatrices[selection]
+            parentMatrices[frame] = poseMatrices[parentIndex[selection]]
+
+        scene.frame_set(currentFrame, subframe=currentSubframe)
+        restMatrices = AnimationSampler.GatherPoseMatrices(poseBones, poseBuffer)[selection]
+
+        parentInverse = AnimationSampler.InvertMatrices(parentMatrices)
+        parentInverse[:, parentIndex[selection] < 0] = np.array(worldToBoneSpace)
+        localMatrices = parentInverse @ boneMatrices
+        translations = localMatrices[..., :3, 3]
+        rotations = AnimationSampler.MatrixToQuaternion(localMatrices)
+
+        return (restMatrices, boneMatrices, translations, rotations)
+
+    def StoreBoneSamples(self, armature, action, boneNames, sampleArrays):
+        restMatrices, boneMatrices, translations, rotations = sampleArrays
+        for j, boneName in enumerate(boneNames):
+            self.boneSamples[(armature, boneName, action)] = (restMatrices[j], boneMatrices[:, j], translations[:, j], rotations[:, j])
+
+    def SampleBones(self, scene, jobArray, frameRange, currentFrame, currentSubframe):
+
+        # This function samples bone actions in this process, one sweep per action, and then
+        # gives each armature its original action back.
+
+        if (len(jobArray) == 0):
+            return
+
+        originalActions = {}
+        for armature, action, boneNames in jobArray:
+            originalActions.setdefault(armature, armature.animation_data.action)
+            self.sweepCount += 1
+            self.StoreBoneSamples(armature, action, boneNames, AnimationSampler.SampleAction(scene, armature, action, boneNames, frameRange, currentFrame, currentSubframe))
+
+        for armature, action in originalActions.items():
+            armature.animation_data.action = action
+        scene.frame_set(currentFrame, subframe=currentSubframe)
+
+
+class AnimationWorkers:
+    # Samples bone actions in background Blender processes so that exports with many clips
+    # use several cores. Every worker opens the saved .blend file, samples its share of the
+    # actions with AnimationSampler.SampleAction, and saves the arrays to a .npz file that
+    # is loaded when the worker is done. The actions of a worker that fails are handed back
+    # to be sampled in this process. Because the workers read the file from disk, they are
+    # only used when the file has been saved and has no unsaved changes.
+    #
+    # Workers start with factory settings, so add-ons aren't enabled in them, and scripts in
+    # the file only run if auto-run is allowed in this session. Python driver expressions may
+    # call functions that only exist here, so workers aren't used when the sampled armatures
+    # or anything they depend on have drivers that aren't simple expressions.
+
+    __slots__ = ("directory", "workerArray")
+
+    def __init__(self, scene, jobArray, workerCount, frameRange, currentFrame, currentSubframe, isolateFlag):
+        self.directory = tempfile.TemporaryDirectory(prefix = "ogex_")
+        self.workerArray = []
+
+        # Hand out the largest actions first, each to the worker with the fewest bones so far.
+
+        shareArray = [[] for i in range(min(workerCount, len(jobArray)))]
+        boneCount = [0] * len(shareArray)
+        for job in sorted(jobArray, key = lambda job: len(job[2]), reverse = True):
+            w = boneCount.index(min(boneCount))
+            shareArray[w].append(job)
+            boneCount[w] += len(job[2])
+
+        for w, share in enumerate(shareArray):
+            jobPath = os.path.join(self.directory.name, "job" + str(w) + ".json")
+            resultPath = os.path.join(self.directory.name, "result" + str(w) + ".npz")
+            logPath = os.path.join(self.directory.name, "log" + str(w) + ".txt")
+
+            with open(jobPath, "w") as jobFile:
+                json.dump({"scene": scene.name, "beginFrame": frameRange.start, "endFrame": frameRange.stop - 1,
+                        "currentFrame": currentFrame, "currentSubframe": currentSubframe, "isolate": isolateFlag,
+                        "jobs": [((armature.name, armature.library.filepath if (armature.library) else None), action, boneNames) for armature, action, boneNames in share]}, jobFile)
+
+            # The worker loads this file by path, so it doesn't matter whether the add-on is
+            # enabled in the factory settings that the worker starts with.
+
+            expression = ("import importlib.util\n"
+                    "spec = importlib.util.spec_from_file_location('ogex_worker', " + repr(os.path.abspath(__file__)) + ")\n"
+                    "module = importlib.util.module_from_spec(spec)\n"
+                    "spec.loader.exec_module(module)\n"
+                    "module.RunAnimationWorker(" + repr(jobPath) + ", " + repr(resultPath) + ")\n")
+            command = [bpy.app.binary_path, "--background", "--factory-startup"]
+            if ((bpy.context.preferences.filepaths.use_scripts_auto_execute) and (not bpy.app.autoexec_fail)):
+                command.append("--enable-autoexec")
+            command.extend([bpy.data.filepath, "--python-exit-code", "1", "--python-expr", expression])
+
+            process = None
+            deadline = time.monotonic() + kWorkerStartTimeout + kWorkerFrameTimeout * len(frameRange) * len(share)
+            with open(logPath, "wb") as logFile:
+                try:
+                    process = subprocess.Popen(command, stdin = subprocess.DEVNULL, stdout = logFile, stderr = subprocess.STDOUT)
+                except OSError as error:
+                    print(f"Could not start animation worker: {error}")
+
+            self.workerArray.append((process, share, resultPath, logPath, deadline))
+
+        print(f"Started {len(self.workerArray)} animation workers for {len(jobArray)} actions")
+
+    @staticmethod
+    def Available(workerCount, jobArray):
+        if ((workerCount <= 0) or (len(jobArray) == 0)):
+            return (False)
+
+        if ((not bpy.data.filepath) or (bpy.data.is_dirty)):
+            print("Animation workers need a saved .blend file, sampling all actions in this process")
+            return (False)
+
+        closure, referenced = SamplingIsolation.Closure({armature for armature, action, boneNames in jobArray})
+        for node in closure:
+            if (AnimationWorkers.PythonDriver(node)):
+                print(f"{node.name} has Python driver expressions, sampling all actions in this process")
+                return (False)
+
+        return (bool(bpy.app.binary_path))
+
+    @staticmethod
+    def PythonDriver(node):
+
+        # This function returns whether an object, its data, or its shape keys have a scripted
+        # driver that Blender can't evaluate as a simple expression without Python.
+
+        shapeKeys = OpenGexExporter.GetShapeKeys(node.data) if (hasattr(node.data, "shape_keys")) else None
+        for animationData in (node.animation_data, getattr(node.data, "animation_data", None), shapeKeys.animation_data if (shapeKeys) else None):
+            if (animationData):
+                for fcurve in animationData.drivers:
+                    driver = fcurve.driver
+                    if ((driver.type == "SCRIPTED") and (not getattr(driver, "is_simple_expression", False))):
+                        return (True)
+
+        return (False)
+
+    def Collect(self, sampler):
+
+        # This function waits for the workers and stores their samples in the sampler. It
+        # returns the jobs that still have to be sampled because their worker failed or was
+        # stopped after running past its deadline.
+
+        failedArray = []
+        for process, share, resultPath, logPath, deadline in self.workerArray:
+            returnCode = None
+            if (process):
+                try:
+                    returnCode = process.wait(timeout = max(deadline - time.monotonic(), 0.0))
+                except subprocess.TimeoutExpired:
+                    print("Animation worker timed out")
+                    process.kill()
+                    process.wait()
+
+            if ((returnCode == 0) and (os.path.exists(resultPath))):
+                with np.load(resultPath) as results:
+                    for j, (armature, action, boneNames) in enumerate(share):
+                        sampler.StoreBoneSamples(armature, action, boneNames, [results[name + str(j)] for name in kWorkerArrayNames])
+                sampler.sweepCount += len(share)
+            else:
+                print(f"Animation worker failed (exit code {returnCode}), sampling {len(share)} actions in this process")
+                with open(logPath, "rb") as logFile:
+                    print(logFile.read()[-kWorkerLogLength:].decode("UTF-8", "replace"))
+                failedArray.extend(share)
+
+        self.workerArray = []
+        return (failedArray)
+
+    def Close(self):
+        for process, share, resultPath, logPath, deadline in self.workerArray:
+            if ((process) and (process.poll() is None)):
+                process.kill()
+                process.wait()
+
+        self.workerArray = []
+        self.directory.cleanup()
+
+
+def RunAnimationWorker(jobPath, resultPath):
+
+    # This function is the entry point of a background Blender process started by
+    # AnimationWorkers. It samples the actions listed in the job file on the .blend file
+    # that Blender opened and saves the arrays to the result file.
+
+    with open(jobPath, "r") as jobFile:
+        job = json.load(jobFile)
+
+    scene = bpy.data.scenes[job["scene"]]
+    frameRange = range(job["beginFrame"], job["endFrame"] + 1)
+    # Armatures are looked up by name and library, since a local object and a linked one can
+    # have the same name.
+
+    jobArray = [(bpy.data.objects[tuple(armatureKey)], action, boneNames) for armatureKey, action, boneNames in job["jobs"]]
+
+    isolation = contextlib.nullcontext()
+    if (job["isolate"]):
+        isolation = SamplingIsolation(list({armature for armature, action, boneNames in jobArray}))
+
+    results = {}
+    with isolation:
+        for j, (armature, action, boneNames) in enumerate(jobArray):
+            sampleArrays = AnimationSampler.SampleAction(scene, armature, action, boneNames, frameRange, job["currentFrame"], job["currentSubframe"])
+            for name, array in zip(kWorkerArrayNames, sampleArrays):
+                results[name + str(j)] = array
+
+    np.savez(resultPath, **results)
 
 
 class OpenGexExporter(bpy.types.Operator, ExportHelper):
@@ -164,35 +1277,57 @@ class OpenGexExporter(bpy.types.Operator, ExportHelper):
 
     option_export_selection: bpy.props.BoolProperty(name = "Export Selection Only", description = "Export only selected objects", default = False)
     option_sample_animation: bpy.props.BoolProperty(name = "Force Sampled Animation", description = "Always export animation as per-frame samples", default = True)
+    option_vertex_unify: bpy.props.EnumProperty(name = "Vertex Unification", description = "Method used to merge identical triangle corners into shared vertices", items = (("SORT", "Sort", "Sort packed vertex records with NumPy"), ("HASH", "Hash", "Search a hash table of vertices one at a time")), default = "SORT")
+    option_weld_vertices: bpy.props.BoolProperty(name = "Weld Vertices", description = "Merge vertices whose attributes round to the same points on grids spaced by the weld tolerances", default = False)
+    option_weld_position: bpy.props.FloatProperty(name = "Position Tolerance", description = "Grid spacing used to weld vertex positions", default = 1.0e-5, min = 0.0, precision = 6)
+    option_weld_normal: bpy.props.FloatProperty(name = "Normal Tolerance", description = "Grid spacing used to weld normals and tangents", default = 1.0e-4, min = 0.0, precision = 6)
+    option_weld_color: bpy.props.FloatProperty(name = "Color Tolerance", description = "Grid spacing used to weld vertex colors", default = 1.0 / 512.0, min = 0.0, precision = 6)
+    option_weld_texcoord: bpy.props.FloatProperty(name = "Texcoord Tolerance", description = "Grid spacing used to weld texture coordinates", default = 1.0e-5, min = 0.0, precision = 6)
+    option_optimize_vertex_cache: bpy.props.BoolProperty(name = "Optimize Vertex Cache", description = "Reorder triangles and vertices of each mesh for better GPU vertex cache and fetch performance", default = False)
+    option_split_index_arrays: bpy.props.BoolProperty(name = "Split Large Index Arrays", description = "Split index arrays that reference 65536 or more vertices into chunks that can use 16-bit indices", default = False)
+    option_isolate_sampling: bpy.props.BoolProperty(name = "Isolate Animation Sampling", description = "While stepping the timeline to sample animation, disable the objects and modifiers that the sampled objects don't depend on", default = False)
+    option_animation_workers: bpy.props.IntProperty(name = "Animation Worker Processes", description = "Number of background Blender processes that sample bone actions in parallel, zero samples everything in this process. The .blend file must be saved", default = 0, min = 0, max = 64)
+    option_direct_animation: bpy.props.BoolProperty(name = "Evaluate F-Curves Directly", description = "Compute sampled animation of objects and shape keys that have no constraints, drivers or NLA tracks from their F-curves instead of stepping the timeline", default = True)
+    option_reduce_keys: bpy.props.BoolProperty(name = "Reduce Sampled Keys", description = "Remove samples from bone and morph weight tracks that linear interpolation reproduces within the tolerances", default = False)
+    option_reduce_position_tolerance: bpy.props.FloatProperty(name = "Translation Tolerance", description = "Largest translation error allowed when removing samples", default = 1.0e-4, min = 0.0, precision = 6)
+    option_reduce_rotation_tolerance: bpy.props.FloatProperty(name = "Rotation Tolerance", description = "Largest rotation error allowed when removing samples", default = math.radians(0.05), min = 0.0, precision = 4, subtype = "ANGLE")
+    option_reduce_weight_tolerance: bpy.props.FloatProperty(name = "Weight Tolerance", description = "Largest morph weight error allowed when removing samples", default = 1.0e-3, min = 0.0, precision = 6)
+    option_compress_tracks: bpy.props.BoolProperty(name = "Compress Bone Tracks", description = "Write bone rotations as 48-bit smallest-three quaternions and translations as 16-bit values normalized to the range of each track", default = False)
+    option_shared_timeline: bpy.props.BoolProperty(name = "Shared Timeline", description = "Write the sample rate and frame count once and have sampled tracks refer to it instead of listing their key times", default = False)
+    option_write_threads: bpy.props.IntProperty(name = "Texture Write Threads", description = "Number of background threads that write texture files while the export continues, zero writes each file immediately", default = 2, min = 0, max = 32)
+    option_write_queue_size: bpy.props.IntProperty(name = "Texture Write Queue", description = "Number of texture files that can wait to be written before the export waits for the writer threads", default = 8, min = 1, max = 256)
+    option_png_compression: bpy.props.IntProperty(name = "PNG Compression", description = "zlib compression level of PNG textures, from 0 (fastest, largest files) to 9 (slowest, smallest files)", default = 6, min = 0, max = 9)
+    option_png_filter: bpy.props.EnumProperty(name = "PNG Filter", description = "Row filter applied to PNG textures before compression", items = (("ADAPTIVE", "Adaptive", "Choose the filter that works best for each row"), ("NONE", "None", "Compress the pixels as they are"), ("SUB", "Sub", "Store the difference from the pixel to the left"), ("UP", "Up", "Store the difference from the pixel above"), ("AVERAGE", "Average", "Store the difference from the average of the pixels to the left and above"), ("PAETH", "Paeth", "Store the difference from the Paeth predictor of the neighboring pixels")), default = "ADAPTIVE")
+    option_texture_cache: bpy.props.BoolProperty(name = "Cache Encoded Textures", description = "Keep encoded textures in a cache directory next to the .ogex file and reuse them while their source images are unchanged", default = False)
+    option_binary_arrays: bpy.props.BoolProperty(name = "Binary Vertex Data", description = "Write vertex, index and skin arrays as packed little-endian data to a .ogexb file next to the .ogex file", default = False)
+    option_profile_report: bpy.props.BoolProperty(name = "Write Timing Report", description = "Write the time spent in each export phase to a .profile.json file next to the .ogex file", default = False)
+    option_profile_python: bpy.props.BoolProperty(name = "Profile Python", description = "Run the export under cProfile and include the slowest functions in the timing report", default = False)
+    option_write_buffer_size: bpy.props.IntProperty(name = "Write Buffer Size (KB)", description = "Amount of text accumulated in memory before it is flushed to the file", default = kWriteFlushSize >> 10, min = 4, max = 1 << 20)
 
     def Write(self, text):
-        self.file.write(text)
+        self.writer.Write(text)
 
     def IndentWrite(self, text, extra = 0, newline = False):
-        if (newline):
-            self.file.write(B"\n")
-        for i in range(self.indentLevel + extra):
-            self.file.write(B"\t")
-        self.file.write(text)
+        self.writer.IndentWrite(self.indentLevel + extra, text, newline)
 
     def WriteString(self, s):
-        self.file.write(bytes(f"\"{s}\"", "UTF-8"))
+        self.writer.Write(bytes(f"\"{s}\"", "UTF-8"))
 
     def WriteInt(self, i):
-        self.file.write(bytes(str(i), "UTF-8"))
+        self.writer.Write(bytes(str(i), "UTF-8"))
 
     def WriteFloat(self, f):
         if ((math.isinf(f)) or (math.isnan(f))):
             # TODO: Should this silently convert to 0, or throw an error? I don't like silent errors.
-            self.file.write(B"0.0")
+            self.writer.Write(B"0.0")
         elif (abs(f) < kExportEpsilon):
-            self.file.write(B"0")
+            self.writer.Write(B"0")
         else:
             as_str = str(round(f, 8))            # As string "3.5"
             #as_int = struct.unpack('<I', struct.pack('<f', f))[0]
             #as_hex = "{0:#010x}".format(as_int)  # As hex string padded with 0s "0x2f000000"
             #as_hex_short = hex(as_int)                 # As hex string "0x2f"
-            self.file.write(bytes(as_str, "UTF-8"))
+            self.writer.Write(bytes(as_str, "UTF-8"))
 
     #| matrices:    11  13 -12  14
     #|              31  33 -32  34
@@ -379,54 +1514,224 @@ class OpenGexExporter(bpy.types.Operator, ExportHelper):
                 self.Write(bytes(filename.replace("\\", "/"), "UTF-8"))
             self.Write(B"\"")
 
-    def WriteIntArray(self, valueArray):
-        count = len(valueArray)
+    @staticmethod
+    def FormatDigits(values, digitCount):
 
-        self.IndentWrite(B"")
-        for i in range(count):
-            self.WriteInt(valueArray[i])
-            if i == count - 1:
-                self.Write(B"\n")
-                break
-            self.Write(B", ")
-            if not (i + 1) % kOutputColumns:
-                self.Write(B"\n")
-                self.IndentWrite(B"")
+        # This function converts non-negative integers below 10^digitCount into a matrix of
+        # ASCII digits, most significant digit first, four digits at a time.
 
-    def WriteFloatArray(self, valueArray):
-        count = len(valueArray)
+        chunkCount = (digitCount + 3) >> 2
+        chunks = np.empty((len(values), chunkCount), dtype = np.uint32)
+        remainder = values.copy()
+        for k in range(chunkCount - 1, -1, -1):
+            chunks[:, k] = kDigitTable[remainder % 10000]
+            remainder //= 10000
 
-        self.IndentWrite(B"")
-        for i in range(count):
-            self.WriteFloat(valueArray[i])
-            if i == count - 1:
-                self.Write(B"\n")
-                break
-            self.Write(B", ")
-            if not (i + 1) % kOutputColumns:
-                self.Write(B"\n")
-                self.IndentWrite(B"")
+        chars = chunks.view(np.uint8)
+        return (chars[:, chunkCount * 4 - digitCount:])
 
-    # x, y
-    def WriteVector2D(self, vector):
-        self.Write(B"[")
-        self.WriteFloat(vector[0])
-        self.Write(B", ")
-        self.WriteFloat(vector[1])
-        self.Write(B"]")
+    @staticmethod
+    def FormatIntArray(valueArray):
 
-    #| vectors:     x z -y
-    # x, y, z
-    def WriteVector3D(self, vector):
-        self.Write(B"[")
-        self.WriteFloat(vector[0])
-        self.Write(B", ")
-        self.WriteFloat(vector[2])
-        self.Write(B", ")
-        self.WriteFloat(-vector[1])
-        self.Write(B"]")
+        # This function formats a whole array of integers at once and returns them as an array
+        # of fixed-width byte strings. Unused characters are zero bytes, which WriteTokenArray skips.
 
-    # def WriteVector3D(self, vector):
+        values = np.asarray(valueArray, dtype = np.int64).ravel()
+        magnitude = np.abs(values)
+        digitCount = np.searchsorted(kPowersOfTen[1:kIntTokenDigits], magnitude, side = "right") + 1
+
+        tokens = np.zeros((len(values), kIntTokenDigits + 1), dtype = np.uint8)
+        tokens[:, 0] = np.where(values < 0, ord("-"), 0)
+        tokens[:, 1:] = OpenGexExporter.FormatDigits(magnitude, kIntTokenDigits)
+        tokens[:, 1:] *= np.arange(kIntTokenDigits) >= (kIntTokenDigits - digitCount)[:, None]
+        return (tokens.view("S" + str(kIntTokenDigits + 1)).ravel())
+
+    @staticmethod
+    def FormatFloatArray(valueArray):
+
+        # This function formats a whole array of scalars at once, with exactly the same
+        # result as calling WriteFloat on each of them: inf/nan become 0.0, values below
+        # kExportEpsilon become 0, and everything else is rounded to 8 digits. The result
+        # is an array of fixed-width byte strings. Unused characters are zero bytes.
+
+        # Each distinct value is only formatted once. Values that came from single precision
+        # data (which is nearly everything Blender hands us) and have a plain positional
+        # representation are converted to digits arithmetically. Scaling a float by 10^8 is
+        # exact in double precision in that case, so rounding the scaled value to an integer
+        # gives the same answer as round(f, 8). Everything else goes through round() and str().
+
+        values = np.asarray(valueArray, dtype = np.float64).ravel()
+        uniqueValues, inverse = np.unique(values, return_inverse = True)
+        tokens = np.zeros(len(uniqueValues), dtype = "S" + str(kFloatTokenWidth))
+
+        with np.errstate(invalid = "ignore", over = "ignore"):
+            magnitude = np.abs(uniqueValues)
+            special = ~np.isfinite(uniqueValues)
+            small = magnitude < kExportEpsilon
+            fast = (magnitude >= 1.0e-4) & (magnitude < 1.0e7)
+            fast &= uniqueValues.astype(np.float32).astype(np.float64) == uniqueValues
+
+        tokens[small] = B"0"
+        tokens[special] = B"0.0"
+
+        slow = ~(special | small | fast)
+        if (np.any(slow)):
+            tokens[slow] = [bytes(str(round(f, 8)), "UTF-8") for f in uniqueValues[slow].tolist()]
+
+        if (np.any(fast)):
+            scaled = np.rint(magnitude[fast] * 1.0e8).astype(np.int64)
+            whole = (scaled // 100000000).astype(np.int32)
+            fraction = (scaled % 100000000).astype(np.int32)
+
+            # Layout: sign, 7 integer digits, decimal point, 8 fraction digits. Leading zeros of
+            # the integer part and trailing zeros of the fraction are dropped, keeping one digit.
+
+            wholeDigits = np.searchsorted(kPowersOfTen[1:7], whole, side = "right") + 1
+            fractionZeros = np.where(fraction % 10000 == 0, kTrailingZeroTable[fraction // 10000] + 4, kTrailingZeroTable[fraction % 10000])
+            fractionDigits = np.maximum(8 - fractionZeros, 1)
+
+            chars = np.zeros((len(scaled), kFloatTokenWidth), dtype = np.uint8)
+            chars[:, 0] = np.where(uniqueValues[fast] < 0.0, ord("-"), 0)
+            chars[:, 1:8] = OpenGexExporter.FormatDigits(whole, 7)
+            chars[:, 1:8] *= np.arange(7) >= (7 - wholeDigits)[:, None]
+            chars[:, 8] = ord(".")
+            chars[:, 9:17] = OpenGexExporter.FormatDigits(fraction, 8)
+            chars[:, 9:17] *= np.arange(8) < fractionDigits[:, None]
+            tokens[fast] = chars.view(tokens.dtype).ravel()
+
+        return (tokens[inverse.ravel()])
+
+    @staticmethod
+    def ConvertVector3DArray(vectorArray):
+        # Same component order as WriteVector3D (x, z, -y).
+        vectors = np.asarray(vectorArray, dtype = np.float32).reshape(-1, 3)
+        return (np.stack((vectors[:, 0], vectors[:, 2], -vectors[:, 1]), axis = 1))
+
+    def WriteTokenArray(self, tokens, groupSize = 1, openText = B"", closeText = B""):
+
+        # This function writes an array of preformatted tokens. Every groupSize tokens form one
+        # element (for example a vector written as "[x, y, z]"), elements are separated by commas,
+        # and kOutputColumns elements are written per line. This produces the same layout as the
+        # per-element loops that used to live in each Write*Array function. The text is assembled
+        # in blocks by compacting a character matrix, so no per-token Python work is done here.
+
+        indent = self.writer.Indent(self.indentLevel)
+        self.Write(indent)
+
+        count = len(tokens)
+        if (count == 0):
+            return
+
+        # Each token is followed by one of four separators depending on its position.
+
+        suffixes = [B", ", closeText + B", ", closeText + B", \n" + indent, closeText + B"\n"]
+        suffixWidth = max(len(suffix) for suffix in suffixes)
+        suffixTable = np.zeros((4, suffixWidth), dtype = np.uint8)
+        suffixValid = np.zeros((4, suffixWidth), dtype = bool)
+        for i in range(4):
+            suffixTable[i, 0:len(suffixes[i])] = np.frombuffer(suffixes[i], dtype = np.uint8)
+            suffixValid[i, 0:len(suffixes[i])] = True
+
+        prefixWidth = len(openText)
+        blockSize = groupSize * kOutputColumns * kOutputBlockRows
+
+        for start in range(0, count, blockSize):
+            end = min(start + blockSize, count)
+            index = np.arange(start, end)
+            component = index % groupSize
+            element = index // groupSize
+
+            suffixClass = np.where(component == groupSize - 1, np.where((element + 1) % kOutputColumns == 0, 2, 1), 0)
+            suffixClass[index == count - 1] = 3
+
+            # Columns that are unused by every token in the block are dropped up front.
+
+            tokenChars = tokens[start:end].view(np.uint8).reshape(end - start, -1)
+            tokenChars = tokenChars[:, 0:np.flatnonzero(tokenChars.any(axis = 0)).max() + 1]
+            tokenWidth = tokenChars.shape[1]
+
+            chars = np.zeros((end - start, prefixWidth + tokenWidth + suffixWidth), dtype = np.uint8)
+            valid = np.zeros(chars.shape, dtype = bool)
+            if (prefixWidth > 0):
+                chars[:, 0:prefixWidth] = np.frombuffer(openText, dtype = np.uint8)
+                valid[:, 0:prefixWidth] = (component == 0)[:, None]
+
+            chars[:, prefixWidth:prefixWidth + tokenWidth] = tokenChars
+            valid[:, prefixWidth:prefixWidth + tokenWidth] = tokenChars != 0
+            chars[:, prefixWidth + tokenWidth:] = suffixTable[suffixClass]
+            valid[:, prefixWidth + tokenWidth:] = suffixValid[suffixClass]
+
+            self.Write(chars[valid].tobytes())
+
+    def WriteIntArray(self, valueArray):
+        self.WriteTokenArray(OpenGexExporter.FormatIntArray(valueArray))
+
+    def WriteFloatArray(self, valueArray):
+        self.WriteTokenArray(OpenGexExporter.FormatFloatArray(valueArray))
+
+    def WriteBinaryReference(self, valueArray, type):
+        format = kArrayFormat[type][0]
+        if (format[1] == "f"):
+            # Match WriteFloat, which writes infinities and NaNs as zero.
+            valueArray = np.nan_to_num(np.asarray(valueArray, dtype = np.float32), nan = 0.0, posinf = 0.0, neginf = 0.0)
+
+        offset, length = self.binaryFile.WriteArray(valueArray, format)
+        self.Write(B"{ offset: ")
+        self.WriteInt(offset)
+        self.Write(B", length: ")
+        self.WriteInt(length)
+        self.Write(B", type: \"")
+        self.Write(type)
+        self.Write(B"\" }")
+
+    def WriteArrayData(self, valueArray, type, groupSize = 0):
+
+        # This function writes the data of a vertex or index array. In text mode this is the
+        # usual "data: [...]" block, and in binary mode the values go to the .ogexb file and
+        # only their location is written here. Vector types are written in brackets. Other
+        # types can be grouped (for example three indices per triangle) with groupSize.
+
+        if (self.binaryFile):
+            self.IndentWrite(B"data: ")
+            self.WriteBinaryReference(valueArray, type)
+            self.Write(B"\n")
+            return
+
+        format, componentCount = kArrayFormat[type]
+        if (format[1] == "f"):
+            tokens = OpenGexExporter.FormatFloatArray(valueArray)
+        else:
+            tokens = OpenGexExporter.FormatIntArray(valueArray)
+
+        self.IndentWrite(B"data: [\n")
+        self.indentLevel += 1
+        if (componentCount > 1):
+            self.WriteTokenArray(tokens, componentCount, B"[", B"]")
+        else:
+            self.WriteTokenArray(tokens, max(groupSize, 1))
+        self.indentLevel -= 1
+        self.IndentWrite(B"]\n")
+
+    # x, y
+    def WriteVector2D(self, vector):
+        self.Write(B"[")
+        self.WriteFloat(vector[0])
+        self.Write(B", ")
+        self.WriteFloat(vector[1])
+        self.Write(B"]")
+
+    #| vectors:     x z -y
+    # x, y, z
+    def WriteVector3D(self, vector):
+        self.Write(B"[")
+        self.WriteFloat(vector[0])
+        self.Write(B", ")
+        self.WriteFloat(vector[2])
+        self.Write(B", ")
+        self.WriteFloat(-vector[1])
+        self.Write(B"]")
+
+    # def WriteVector3D(self, vector):
     #     self.Write(B"[")
     #     self.WriteFloat(vector[0])
     #     self.Write(B", ")
@@ -503,76 +1808,26 @@ class OpenGexExporter(bpy.types.Operator, ExportHelper):
     #     self.WriteFloat(quaternion[0])
     #     self.Write(B"]")
 
-    def WriteVertexArray2D(self, vertexArray, attrib):
-        count = len(vertexArray)
+    def WriteVertexArray2D(self, vertexTable, attrib):
+        self.WriteArrayData(getattr(vertexTable, attrib), B"vec2")
 
-        self.IndentWrite(B"")
-        for i in range(count):
-            self.WriteVector2D(getattr(vertexArray[i], attrib))
-            if i == count - 1:
-                self.Write(B"\n")
-                break
-            self.Write(B", ")
-            if not (i + 1) % kOutputColumns:
-                self.Write(B"\n")
-                self.IndentWrite(B"")
+    def WriteVertexArray3D(self, vertexTable, attrib):
+        self.WriteArrayData(OpenGexExporter.ConvertVector3DArray(getattr(vertexTable, attrib)), B"vec3")
 
-    def WriteVertexArray3D(self, vertexArray, attrib):
-        count = len(vertexArray)
+    def WriteMorphPositionArray3D(self, vertexTable, meshVertexArray):
+        position = OpenGexExporter.GatherArray(meshVertexArray, "co", 3)
+        self.WriteArrayData(OpenGexExporter.ConvertVector3DArray(position[vertexTable.vertexIndex]), B"vec3")
 
-        self.IndentWrite(B"")
-        for i in range(count):
-            self.WriteVector3D(getattr(vertexArray[i], attrib))
-            if i == count - 1:
-                self.Write(B"\n")
-                break
-            self.Write(B", ")
-            if not (i + 1) % kOutputColumns:
-                self.Write(B"\n")
-                self.IndentWrite(B"")
+    def WriteMorphNormalArray3D(self, vertexTable, meshVertexArray, tessFaceArray):
+        vertexNormal = OpenGexExporter.GatherArray(meshVertexArray, "normal", 3)
+        faceNormal = OpenGexExporter.GatherArray(tessFaceArray, "normal", 3)
+        smooth = OpenGexExporter.GatherArray(tessFaceArray, "use_smooth", 1, bool)
+        normal = np.where(smooth[vertexTable.faceIndex, None], vertexNormal[vertexTable.vertexIndex], faceNormal[vertexTable.faceIndex])
+        self.WriteArrayData(OpenGexExporter.ConvertVector3DArray(normal), B"vec3")
 
-    def WriteMorphPositionArray3D(self, vertexArray, meshVertexArray):
-        count = len(vertexArray)
-
-        self.IndentWrite(B"")
-        for i in range(count):
-            self.WriteVector3D(meshVertexArray[vertexArray[i].vertexIndex].co)
-            if i == count - 1:
-                self.Write(B"\n")
-                break
-            self.Write(B", ")
-            if not (i + 1) % kOutputColumns:
-                self.Write(B"\n")
-                self.IndentWrite(B"")
-
-    def WriteMorphNormalArray3D(self, vertexArray, meshVertexArray, tessFaceArray):
-        count = len(vertexArray)
-
-        self.IndentWrite(B"")
-        for i in range(count):
-            face = tessFaceArray[vertexArray[i].faceIndex]
-            self.WriteVector3D(meshVertexArray[vertexArray[i].vertexIndex].normal if (face.use_smooth) else face.normal)
-            if i == count - 1:
-                self.Write(B"\n")
-                break
-            self.Write(B", ")
-            if not (i + 1) % kOutputColumns:
-                self.Write(B"\n")
-                self.IndentWrite(B"")
-
-    def WriteMorphTangentArray3D(self, vertexArray, mesh, meshVertexArray, tessFaceArray):
-        count = len(vertexArray)
-
-        self.IndentWrite(B"")
-        for i in range(count):
-            self.WriteVector3D(mesh.loops[vertexArray[i].vertexIndex].tangent)
-            if i == count - 1:
-                self.Write(B"\n")
-                break
-            self.Write(B", ")
-            if not (i + 1) % kOutputColumns:
-                self.Write(B"\n")
-                self.IndentWrite(B"")
+    def WriteMorphTangentArray3D(self, vertexTable, mesh, meshVertexArray, tessFaceArray):
+        tangent = OpenGexExporter.GatherArray(mesh.loops, "tangent", 3)
+        self.WriteArrayData(OpenGexExporter.ConvertVector3DArray(tangent[vertexTable.vertexIndex]), B"vec3")
 
         # vertexArray = mesh.vertices
         # exportVertexArray = []
@@ -622,17 +1877,8 @@ class OpenGexExporter(bpy.types.Operator, ExportHelper):
         self.Write(B", ")
         self.WriteInt(indexTable[i + 2])
 
-    def WriteTriangleArray(self, count, indexTable):
-        self.IndentWrite(B"")
-        for i in range(count):
-            self.WriteTriangle(i, indexTable)
-            if i == count - 1:
-                self.Write(B"\n")
-                break
-            self.Write(B", ")
-            if not (i + 1) % kOutputColumns:
-                self.Write(B"\n")
-                self.IndentWrite(B"")
+    def WriteTriangleArray(self, count, indexTable, type = B"u32"):
+        self.WriteArrayData(np.asarray(indexTable[0:count * 3], dtype = np.uint32), type, 3)
 
     def WriteNodeTable(self, objectRef):
         first = True
@@ -673,97 +1919,61 @@ class OpenGexExporter(bpy.types.Operator, ExportHelper):
         return (None)
 
     @staticmethod
-    def DeindexMesh(mesh, materialTable):
+    def GatherArray(collection, attrib, componentCount, dtype = np.float32):
+
+        # This function reads one attribute of every element in a Blender collection into a
+        # flat NumPy array with foreach_get, reshaped to one row per element.
+
+        array = np.empty(len(collection) * componentCount, dtype = dtype)
+        collection.foreach_get(attrib, array)
+        if (componentCount > 1):
+            return (array.reshape(-1, componentCount))
+        return (array)
+
+    @staticmethod
+    def DeindexMesh(mesh):
 
         # This function deindexes all vertex positions, colors, and texcoords.
-        # Three separate ExportVertex structures are created for each triangle.
+        # The result is an ExportVertexTable with three rows for each triangle,
+        # and an array holding the material index of each triangle.
 
-        vertexArray = mesh.vertices
-        exportVertexArray = []
-        faceIndex = 0
-
-        for face in mesh.polygons:
-            assert(len(face.vertices) == 3)
-
-            # Need to get tangents from loops, but position/normals from vertices??
-            l1 = mesh.loops[face.loop_indices[0]]
-            l2 = mesh.loops[face.loop_indices[1]]
-            l3 = mesh.loops[face.loop_indices[2]]
-
-            k1 = face.vertices[0]
-            k2 = face.vertices[1]
-            k3 = face.vertices[2]
-
-            v1 = vertexArray[k1]
-            v2 = vertexArray[k2]
-            v3 = vertexArray[k3]
-
-            exportVertex = ExportVertex()
-            exportVertex.vertexIndex = k1
-            exportVertex.faceIndex = faceIndex
-            exportVertex.position = v1.co
-            exportVertex.normal = v1.normal if (face.use_smooth) else face.normal
-            exportVertex.tangent = l1.tangent
-            exportVertexArray.append(exportVertex)
-
-            exportVertex = ExportVertex()
-            exportVertex.vertexIndex = k2
-            exportVertex.faceIndex = faceIndex
-            exportVertex.position = v2.co
-            exportVertex.normal = v2.normal if (face.use_smooth) else face.normal
-            exportVertex.tangent = l2.tangent
-            exportVertexArray.append(exportVertex)
-
-            exportVertex = ExportVertex()
-            exportVertex.vertexIndex = k3
-            exportVertex.faceIndex = faceIndex
-            exportVertex.position = v3.co
-            exportVertex.normal = v3.normal if (face.use_smooth) else face.normal
-            exportVertex.tangent = l3.tangent
-            exportVertexArray.append(exportVertex)
-
-            materialTable.append(face.material_index)
-            faceIndex += 1
-
-        colorCount = len(mesh.vertex_colors)
-        if (colorCount > 0):
-            colorFace = mesh.vertex_colors[0].data
-            vertexIndex = 0
-            faceIndex = 0
-
-            for face in mesh.loop_triangles:
-                cf = colorFace[faceIndex]
-                exportVertexArray[vertexIndex].color = cf.color1
-                vertexIndex += 1
-                exportVertexArray[vertexIndex].color = cf.color2
-                vertexIndex += 1
-                exportVertexArray[vertexIndex].color = cf.color3
-                vertexIndex += 1
-                faceIndex += 1
+        triangleArray = mesh.loop_triangles
+        triangleCount = len(triangleArray)
+
+        loopIndex = OpenGexExporter.GatherArray(triangleArray, "loops", 3, np.int32).ravel()
+        vertexIndex = OpenGexExporter.GatherArray(triangleArray, "vertices", 3, np.int32).ravel()
+        polygonIndex = OpenGexExporter.GatherArray(triangleArray, "polygon_index", 1, np.int32)
+
+        polygonArray = mesh.polygons
+        smooth = OpenGexExporter.GatherArray(polygonArray, "use_smooth", 1, bool)[polygonIndex]
+        faceNormal = OpenGexExporter.GatherArray(polygonArray, "normal", 3)[polygonIndex]
+        materialTable = OpenGexExporter.GatherArray(polygonArray, "material_index", 1, np.int32)[polygonIndex]
+
+        vertexTable = ExportVertexTable(triangleCount * 3)
+        vertexTable.vertexIndex = vertexIndex
+        vertexTable.faceIndex = np.repeat(np.arange(triangleCount, dtype = np.int32), 3)
+        vertexTable.position = OpenGexExporter.GatherArray(mesh.vertices, "co", 3)[vertexIndex]
+
+        # Smooth faces use the vertex normal, and flat faces use the face normal.
+
+        vertexNormal = OpenGexExporter.GatherArray(mesh.vertices, "normal", 3)[vertexIndex]
+        vertexTable.normal = np.where(np.repeat(smooth, 3)[:, None], vertexNormal, np.repeat(faceNormal, 3, axis = 0))
+        vertexTable.tangent = OpenGexExporter.GatherArray(mesh.loops, "tangent", 3)[loopIndex]
+
+        if (len(mesh.vertex_colors) > 0):
+            color = OpenGexExporter.GatherArray(mesh.vertex_colors[0].data, "color", 4)
+            vertexTable.color = color[loopIndex, 0:3]
 
         # TODO: Export multiple UV layers
         # https://wiki.blender.org/wiki/Reference/Release_Notes/2.80/Python_API/Mesh_API
-        #for uv_layer in mesh.uv_layers:
-            #    for tri in mesh.loop_triangles:
-            #        for loop_index in tri.loops:
-            #            exportVertexArray[vertexIndex].texcoord0 = uv_layer.data[loop_index].uv
-            #            vertexIndex += 1
 
         texcoordCount = len(mesh.uv_layers)
         if (texcoordCount > 0):
-            vertexIndex = 0
-            for tri in mesh.loop_triangles:
-                assert(len(tri.loops) == 3)
-                for loop_index in tri.loops:
-                    exportVertexArray[vertexIndex].texcoord0 = mesh.uv_layers[0].data[loop_index].uv
-                    if (texcoordCount > 1):
-                        exportVertexArray[vertexIndex].texcoord1 = mesh.uv_layers[1].data[loop_index].uv
-                    vertexIndex += 1
-
-        for ev in exportVertexArray:
-            ev.Hash()
+            vertexTable.texcoord0 = OpenGexExporter.GatherArray(mesh.uv_layers[0].data, "uv", 2)[loopIndex]
+            if (texcoordCount > 1):
+                vertexTable.texcoord1 = OpenGexExporter.GatherArray(mesh.uv_layers[1].data, "uv", 2)[loopIndex]
 
-        return (exportVertexArray)
+        return (vertexTable, materialTable)
 
     @staticmethod
     def FindExportVertex(bucket, exportVertexArray, vertex):
@@ -774,11 +1984,14 @@ class OpenGexExporter(bpy.types.Operator, ExportHelper):
         return (-1)
 
     @staticmethod
-    def UnifyVertices(exportVertexArray, indexTable):
+    def UnifyVertices(vertexTable):
 
         # This function looks for identical vertices having exactly the same position, normal,
         # color, and texcoords. Duplicate vertices are unified, and a new index table is returned.
 
+        exportVertexArray = vertexTable.ExportVertices()
+        indexTable = []
+
         bucketCount = len(exportVertexArray) >> 3
         if (bucketCount > 1):
 
@@ -793,20 +2006,265 @@ class OpenGexExporter(bpy.types.Operator, ExportHelper):
             bucketCount = 1
 
         hashTable = [[] for i in range(bucketCount)]
-        unifiedVertexArray = []
+        unifiedIndexArray = []
 
         for i in range(len(exportVertexArray)):
             ev = exportVertexArray[i]
             bucket = ev.hash & (bucketCount - 1)
             index = OpenGexExporter.FindExportVertex(hashTable[bucket], exportVertexArray, ev)
             if (index < 0):
-                indexTable.append(len(unifiedVertexArray))
-                unifiedVertexArray.append(ev)
+                indexTable.append(len(unifiedIndexArray))
+                unifiedIndexArray.append(i)
                 hashTable[bucket].append(i)
             else:
                 indexTable.append(indexTable[index])
 
-        return (unifiedVertexArray)
+        return (vertexTable.Select(np.array(unifiedIndexArray, dtype = np.int64)), np.array(indexTable, dtype = np.uint32))
+
+    @staticmethod
+    def SortUnifyVertices(vertexTable):
+
+        # This function produces the same result as UnifyVertices, but finds the identical
+        # vertices by packing all attributes of each corner into one fixed-size record and
+        # sorting the records with np.unique. Unified vertices are kept in the order of their
+        # first occurrence so that the output matches the hash-based search exactly.
+
+        cornerCount = len(vertexTable)
+        attribs = np.concatenate((vertexTable.position, vertexTable.normal, vertexTable.tangent, vertexTable.color, vertexTable.texcoord0, vertexTable.texcoord1), axis = 1)
+
+        # Adding zero turns -0.0 into 0.0, which compares equal to it. A NaN never compares
+        # equal to anything, so each corner containing one gets a distinct record.
+
+        records = np.zeros((cornerCount, attribs.shape[1] + 1), dtype = np.float32)
+        records[:, :-1] = attribs + np.float32(0.0)
+        nanCorners = np.isnan(attribs).any(axis = 1)
+        records.view(np.uint32)[:, -1] = np.where(nanCorners, np.arange(1, cornerCount + 1, dtype = np.uint32), 0)
+
+        keys = np.ascontiguousarray(records).view(np.dtype((np.void, records.shape[1] * 4))).ravel()
+        _, firstIndex, inverse = np.unique(keys, return_index = True, return_inverse = True)
+
+        order = np.argsort(firstIndex, kind = "stable")
+        rank = np.empty(len(order), dtype = np.uint32)
+        rank[order] = np.arange(len(order), dtype = np.uint32)
+        return (vertexTable.Select(firstIndex[order]), rank[inverse.ravel()])
+
+    @staticmethod
+    def PartitionTriangles(materialTable, indexTable):
+
+        # This function splits the triangles by material index in a single pass. A stable sort
+        # keeps the original triangle order within each material. The result is a list of
+        # (materialIndex, triangleIndexArray) pairs for the materials that have triangles,
+        # where each triangleIndexArray holds three vertex indices per row.
+
+        triangleIndexArray = np.asarray(indexTable, dtype = np.uint32).reshape(-1, 3)
+        if (len(materialTable) == 0):
+            return ([])
+
+        order = np.argsort(materialTable, kind = "stable")
+        counts = np.bincount(materialTable)
+        sortedTriangles = triangleIndexArray[order]
+
+        submeshArray = []
+        start = 0
+        for materialIndex in np.flatnonzero(counts).tolist():
+            end = start + counts[materialIndex]
+            submeshArray.append((materialIndex, sortedTriangles[start:end]))
+            start = end
+
+        return (submeshArray)
+
+    @staticmethod
+    def SplitIndexArray(triangleIndexArray, splitFlag):
+
+        # This function chooses the index format for the triangles of one submesh. If the
+        # referenced vertices span fewer than 65536 entries, the indices are written as u16,
+        # relative to a base vertex when the span does not start at zero. Otherwise the submesh
+        # is written as u32, or if splitFlag is set, it is split in triangle order into chunks
+        # that can each use u16 indices. A list of (baseVertex, vertexCount, type, triangles)
+        # tuples is returned, where baseVertex is zero for indices that are not relative.
+
+        if (len(triangleIndexArray) == 0):
+            return ([(0, 0, B"u16", triangleIndexArray)])
+
+        triangleMin = triangleIndexArray.min(axis = 1).astype(np.int64)
+        triangleMax = triangleIndexArray.max(axis = 1).astype(np.int64)
+        low = int(triangleMin.min())
+        high = int(triangleMax.max())
+
+        if (high < kShortIndexLimit):
+            return ([(0, high + 1, B"u16", triangleIndexArray)])
+        if (high - low < kShortIndexLimit):
+            return ([(low, high - low + 1, B"u16", triangleIndexArray)])
+        if (not splitFlag):
+            return ([(0, high + 1, B"u32", triangleIndexArray)])
+
+        chunkArray = []
+        start = 0
+        triangleCount = len(triangleIndexArray)
+        while (start < triangleCount):
+
+            # The span of a chunk only grows as triangles are added, so the number of triangles
+            # that fit can be found with a binary search over the running span.
+
+            span = np.maximum.accumulate(triangleMax[start:]) - np.minimum.accumulate(triangleMin[start:])
+            end = start + int(np.searchsorted(span, kShortIndexLimit))
+            if (end == start):
+
+                # A single triangle can span too many vertices for u16 indices.
+
+                chunkArray.append((0, int(triangleMax[start]) + 1, B"u32", triangleIndexArray[start:start + 1]))
+                start += 1
+                continue
+
+            low = int(triangleMin[start:end].min())
+            high = int(triangleMax[start:end].max())
+            chunkArray.append((low, high - low + 1, B"u16", triangleIndexArray[start:end]))
+            start = end
+
+        return (chunkArray)
+
+    @staticmethod
+    def OptimizeTriangleOrder(triangleIndexArray):
+
+        # This function reorders the triangles of one submesh for better post-transform vertex
+        # cache use. Triangles are emitted greedily, always choosing the one whose vertices
+        # have the highest combined score: vertices recently used in the simulated cache and
+        # vertices with few remaining triangles score highest.
+
+        triangleCount = len(triangleIndexArray)
+        if (triangleCount < 2):
+            return (triangleIndexArray)
+
+        vertexArray, cornerArray = np.unique(triangleIndexArray, return_inverse = True)
+        vertexCount = len(vertexArray)
+        corners = cornerArray.reshape(-1, 3).tolist()
+
+        # Build the list of triangles using each vertex.
+
+        order = np.argsort(cornerArray.ravel(), kind = "stable") // 3
+        valence = np.bincount(cornerArray.ravel(), minlength = vertexCount)
+        offsets = np.concatenate(([0], np.cumsum(valence))).tolist()
+        order = order.tolist()
+        vertexTriangles = [order[offsets[v]:offsets[v + 1]] for v in range(vertexCount)]
+        remaining = valence.tolist()
+
+        cacheScore = kCacheScoreTable
+        valenceScore = kValenceScoreTable
+        lastValence = kMaxValenceScore - 1
+
+        vertexScore = [valenceScore[min(r, lastValence)] for r in remaining]
+        triangleScore = [vertexScore[a] + vertexScore[b] + vertexScore[c] for a, b, c in corners]
+        emitted = [False] * triangleCount
+
+        cache = []
+        outputArray = []
+        best = triangleScore.index(max(triangleScore))
+        nextScan = 0
+
+        while True:
+            emitted[best] = True
+            outputArray.append(best)
+            triangle = corners[best]
+            for v in triangle:
+                remaining[v] -= 1
+                vertexTriangles[v].remove(best)
+
+            if (len(outputArray) == triangleCount):
+                break
+
+            # Move the triangle's vertices to the front of the cache and rescore everything
+            # that was in the cache, including vertices that just dropped out of it.
+
+            cache = triangle + [v for v in cache if v not in triangle]
+            for i, v in enumerate(cache):
+                score = 0.0
+                if (remaining[v] > 0):
+                    if (i < kVertexCacheSize):
+                        score = cacheScore[i]
+                    score += valenceScore[min(remaining[v], lastValence)]
+                vertexScore[v] = score
+
+            best = -1
+            bestScore = -1.0
+            for v in cache:
+                for t in vertexTriangles[v]:
+                    a, b, c = corners[t]
+                    score = vertexScore[a] + vertexScore[b] + vertexScore[c]
+                    triangleScore[t] = score
+                    if (score > bestScore):
+                        best = t
+                        bestScore = score
+
+            del cache[kVertexCacheSize:]
+
+            if (best < 0):
+
+                # Nothing in the cache is connected to a remaining triangle, so continue with
+                # the first remaining triangle in the original order.
+
+                while (emitted[nextScan]):
+                    nextScan += 1
+                best = nextScan
+
+        return (triangleIndexArray[outputArray])
+
+    @staticmethod
+    def CacheStatistics(triangleIndexArray):
+
+        # This function simulates a FIFO post-transform cache and returns the average cache
+        # miss ratio (misses per triangle) and the average transform to vertex ratio (misses
+        # per distinct vertex).
+
+        triangleCount = len(triangleIndexArray)
+        if (triangleCount == 0):
+            return (0.0, 0.0)
+
+        cache = set()
+        fifo = []
+        misses = 0
+        for v in triangleIndexArray.ravel().tolist():
+            if (v not in cache):
+                misses += 1
+                cache.add(v)
+                fifo.append(v)
+                if (len(fifo) > kVertexCacheStatisticsSize):
+                    cache.discard(fifo.pop(0))
+
+        vertexCount = len(np.unique(triangleIndexArray))
+        return (misses / triangleCount, misses / vertexCount)
+
+    @staticmethod
+    def OptimizeVertexCache(vertexTable, submeshArray):
+
+        # This function reorders the triangles of each submesh, and then renumbers the vertices
+        # in the order they are first referenced so that vertex fetches are mostly sequential.
+        # The reordered vertex table and submesh array are returned.
+
+        optimizedArray = []
+        for materialIndex, triangleIndexArray in submeshArray:
+            beforeAcmr, beforeAtvr = OpenGexExporter.CacheStatistics(triangleIndexArray)
+            triangleIndexArray = OpenGexExporter.OptimizeTriangleOrder(triangleIndexArray)
+            afterAcmr, afterAtvr = OpenGexExporter.CacheStatistics(triangleIndexArray)
+            print(f"  material {materialIndex}: {len(triangleIndexArray)} triangles, ACMR {beforeAcmr:.3f} -> {afterAcmr:.3f}, ATVR {beforeAtvr:.3f} -> {afterAtvr:.3f}")
+            optimizedArray.append((materialIndex, triangleIndexArray))
+
+        if (len(optimizedArray) == 0):
+            return (vertexTable, optimizedArray)
+
+        vertexCount = len(vertexTable)
+        references = np.concatenate([triangleIndexArray.ravel() for _, triangleIndexArray in optimizedArray])
+        _, firstReference = np.unique(references, return_index = True)
+        fetchOrder = references[np.sort(firstReference)].astype(np.int64)
+
+        # Vertices not used by any triangle go last.
+
+        unused = np.ones(vertexCount, dtype = bool)
+        unused[fetchOrder] = False
+        fetchOrder = np.concatenate((fetchOrder, np.flatnonzero(unused)))
+
+        remap = np.empty(vertexCount, dtype = np.uint32)
+        remap[fetchOrder] = np.arange(vertexCount, dtype = np.uint32)
+        return (vertexTable.Select(fetchOrder), [(materialIndex, remap[triangleIndexArray]) for materialIndex, triangleIndexArray in optimizedArray])
 
     def ProcessBone(self, bone):
         if ((self.exportAllFlag) or (bone.select)):
@@ -815,6 +2273,7 @@ class OpenGexExporter(bpy.types.Operator, ExportHelper):
         for subnode in bone.children:
             self.ProcessBone(subnode)
 
+    @ProfiledSection
     def ProcessNode(self, node):
         if ((self.exportAllFlag) or (node.select)):
             type = OpenGexExporter.GetNodeType(node)
@@ -849,64 +2308,51 @@ class OpenGexExporter(bpy.types.Operator, ExportHelper):
                             boneRef[1]["nodeType"] = kNodeTypeBone
 
     @staticmethod
-    def ClassifyAnimationCurve(fcurve):
-        linearCount = 0
-        bezierCount = 0
-
-        for key in fcurve.keyframe_points:
-            interp = key.interpolation
-            if (interp == "LINEAR"):
-                linearCount += 1
-            elif (interp == "BEZIER"):
-                bezierCount += 1
-            else:
-                return (kAnimationSampled)
+    def ClassifyAnimationCurve(keyframeTable):
+        interpolation = keyframeTable.interpolation
+        if (not interpolation.issubset(("LINEAR", "BEZIER"))):
+            return (kAnimationSampled)
 
-        if (bezierCount == 0):
+        if ("BEZIER" not in interpolation):
             return (kAnimationLinear)
-        elif (linearCount == 0):
+        elif ("LINEAR" not in interpolation):
             return (kAnimationBezier)
 
         return (kAnimationSampled)
 
     @staticmethod
-    def AnimationKeysDifferent(fcurve):
-        keyCount = len(fcurve.keyframe_points)
-        if (keyCount > 0):
-            key1 = fcurve.keyframe_points[0].co[1]
-
-            for i in range(1, keyCount):
-                key2 = fcurve.keyframe_points[i].co[1]
-                if (math.fabs(key2 - key1) > kExportEpsilon):
-                    return (True)
+    def AnimationKeysDifferent(keyframeTable):
+        value = keyframeTable.co[:, 1]
+        if (len(value) > 0):
+            return (bool(np.any(np.abs(value - value[0]) > kExportEpsilon)))
 
         return (False)
 
     @staticmethod
-    def AnimationTangentsNonzero(fcurve):
-        keyCount = len(fcurve.keyframe_points)
-        if (keyCount > 0):
-            key = fcurve.keyframe_points[0].co[1]
-            left = fcurve.keyframe_points[0].handle_left[1]
-            right = fcurve.keyframe_points[0].handle_right[1]
-            if ((math.fabs(key - left) > kExportEpsilon) or (math.fabs(right - key) > kExportEpsilon)):
-                return (True)
-
-            for i in range(1, keyCount):
-                key = fcurve.keyframe_points[i].co[1]
-                left = fcurve.keyframe_points[i].handle_left[1]
-                right = fcurve.keyframe_points[i].handle_right[1]
-                if ((math.fabs(key - left) > kExportEpsilon) or (math.fabs(right - key) > kExportEpsilon)):
-                    return (True)
-
-        return (False)
+    def AnimationTangentsNonzero(keyframeTable):
+        value = keyframeTable.co[:, 1]
+        left = keyframeTable.handleLeft[:, 1]
+        right = keyframeTable.handleRight[:, 1]
+        return (bool(np.any((np.abs(value - left) > kExportEpsilon) | (np.abs(right - value) > kExportEpsilon))))
 
     @staticmethod
-    def AnimationPresent(fcurve, kind):
+    def AnimationPresent(keyframeTable, kind):
         if (kind != kAnimationBezier):
-            return (OpenGexExporter.AnimationKeysDifferent(fcurve))
+            return (OpenGexExporter.AnimationKeysDifferent(keyframeTable))
+
+        return ((OpenGexExporter.AnimationKeysDifferent(keyframeTable)) or (OpenGexExporter.AnimationTangentsNonzero(keyframeTable)))
+
+    def GetKeyframeTable(self, fcurve):
+
+        # This function returns the keyframe arrays of an F-curve, reading them from Blender
+        # only the first time so that classification and export share the same arrays.
+
+        keyframeTable = self.keyframeTables.get(fcurve)
+        if (keyframeTable is None):
+            keyframeTable = KeyframeTable(fcurve)
+            self.keyframeTables[fcurve] = keyframeTable
 
-        return ((OpenGexExporter.AnimationKeysDifferent(fcurve)) or (OpenGexExporter.AnimationTangentsNonzero(fcurve)))
+        return (keyframeTable)
 
     @staticmethod
     def Vec3Different(v1, v2):
@@ -933,19 +2379,6 @@ class OpenGexExporter(bpy.types.Operator, ExportHelper):
 
         return (False)
 
-    @staticmethod
-    def CollectBoneActions(boneName):
-        path = "pose.bones[\"" + boneName + "\"]."
-        actions = []
-
-        for action in bpy.data.actions:
-            for fcurve in action.fcurves:
-                if (fcurve.data_path.startswith(path)):
-                    actions.append(action.name)
-                    break
-
-        return (actions)
-
     # @staticmethod
     # def HasBoneAnimation(armature, name):
     #     path = "pose.bones[\"" + name + "\"]."
@@ -967,133 +2400,42 @@ class OpenGexExporter(bpy.types.Operator, ExportHelper):
 
     #     return False
 
-    def ExportKeyTimes(self, fcurve):
-        self.IndentWrite(B"key: {\n")
-        self.indentLevel += 1
-        self.IndentWrite(B"kind: \"value\"\n")
-        self.IndentWrite(B"type: \"float\"\n")
-        self.IndentWrite(B"data: [\n")
-        self.indentLevel += 1
-
-        keyCount = len(fcurve.keyframe_points)
-        for i in range(keyCount):
-            if (i > 0):
-                self.Write(B", ")
-
-            time = fcurve.keyframe_points[i].co[0] - self.beginFrame
-            self.WriteFloat(time * self.frameTime)
-
-        self.indentLevel -= 1
-        self.IndentWrite(B"]\n")
-        self.indentLevel -= 1
-        self.IndentWrite(B"}\n")
-
-    def ExportKeyTimeControlPoints(self, fcurve):
-        self.IndentWrite(B"key: {\n")
-        self.indentLevel += 1
-        self.IndentWrite(B"kind: \"-control\"\n")
-        self.IndentWrite(B"type: \"float\"\n")
-        self.IndentWrite(B"data: [\n")
-        self.indentLevel += 1
-
-        keyCount = len(fcurve.keyframe_points)
-        for i in range(keyCount):
-            if (i > 0):
-                self.Write(B", ")
-
-            ctrl = fcurve.keyframe_points[i].handle_left[0] - self.beginFrame
-            self.WriteFloat(ctrl * self.frameTime)
-
-        self.indentLevel -= 1
-        self.IndentWrite(B"]\n")
-        self.indentLevel -= 1
-        self.IndentWrite(B"}\n")
-
-        self.IndentWrite(B"key: {\n")
-        self.indentLevel += 1
-        self.IndentWrite(B"kind: \"+control\"\n")
-        self.IndentWrite(B"type: \"float\"\n")
-        self.IndentWrite(B"data: [\n")
-        self.indentLevel += 1
-
-        for i in range(keyCount):
-            if (i > 0):
-                self.Write(B", ")
-
-            ctrl = fcurve.keyframe_points[i].handle_right[0] - self.beginFrame
-            self.WriteFloat(ctrl * self.frameTime)
-
-        self.indentLevel -= 1
-        self.IndentWrite(B"]\n")
-        self.indentLevel -= 1
-        self.IndentWrite(B"}\n")
-
-    def ExportKeyValues(self, fcurve):
-        self.IndentWrite(B"key: {\n")
-        self.indentLevel += 1
-        self.IndentWrite(B"kind: \"value\"\n")
-        self.IndentWrite(B"type: \"float\"\n")
-        self.IndentWrite(B"data: [\n")
-        self.indentLevel += 1
-
-        keyCount = len(fcurve.keyframe_points)
-        for i in range(keyCount):
-            if (i > 0):
-                self.Write(B", ")
-
-            value = fcurve.keyframe_points[i].co[1]
-            self.WriteFloat(value)
-
-        self.indentLevel -= 1
-        self.IndentWrite(B"]\n")
-        self.indentLevel -= 1
-        self.IndentWrite(B"}\n")
-
-    def ExportKeyValueControlPoints(self, fcurve):
+    def ExportKeyArray(self, kind, valueArray):
         self.IndentWrite(B"key: {\n")
         self.indentLevel += 1
-        self.IndentWrite(B"kind: \"-control\"\n")
+        self.IndentWrite(B"kind: \"" + kind + B"\"\n")
         self.IndentWrite(B"type: \"float\"\n")
         self.IndentWrite(B"data: [\n")
         self.indentLevel += 1
 
-        keyCount = len(fcurve.keyframe_points)
-        for i in range(keyCount):
-            if (i > 0):
-                self.Write(B", ")
-
-            ctrl = fcurve.keyframe_points[i].handle_left[1]
-            self.WriteFloat(ctrl)
+        self.WriteFloatArray(valueArray)
 
         self.indentLevel -= 1
         self.IndentWrite(B"]\n")
         self.indentLevel -= 1
         self.IndentWrite(B"}\n")
 
-        self.IndentWrite(B"key: {\n")
-        self.indentLevel += 1
-        self.IndentWrite(B"kind: \"+control\"\n")
-        self.IndentWrite(B"type: \"float\"\n")
-        self.IndentWrite(B"data: [\n")
-        self.indentLevel += 1
+    def ExportKeyTimes(self, keyframeTable):
+        self.ExportKeyArray(B"value", (keyframeTable.co[:, 0] - self.beginFrame) * self.frameTime)
 
-        for i in range(keyCount):
-            if (i > 0):
-                self.Write(B", ")
+    def ExportKeyTimeControlPoints(self, keyframeTable):
+        self.ExportKeyArray(B"-control", (keyframeTable.handleLeft[:, 0] - self.beginFrame) * self.frameTime)
+        self.ExportKeyArray(B"+control", (keyframeTable.handleRight[:, 0] - self.beginFrame) * self.frameTime)
 
-            ctrl = fcurve.keyframe_points[i].handle_right[1]
-            self.WriteFloat(ctrl)
+    def ExportKeyValues(self, keyframeTable):
+        self.ExportKeyArray(B"value", keyframeTable.co[:, 1])
 
-        self.indentLevel -= 1
-        self.IndentWrite(B"]\n")
-        self.indentLevel -= 1
-        self.IndentWrite(B"}\n")
+    def ExportKeyValueControlPoints(self, keyframeTable):
+        self.ExportKeyArray(B"-control", keyframeTable.handleLeft[:, 1])
+        self.ExportKeyArray(B"+control", keyframeTable.handleRight[:, 1])
 
     def ExportAnimationTrack(self, fcurve, kind, target, target_index, newline):
 
         # This function exports a single animation track. The curve types for the
         # Time and Value structures are given by the kind parameter.
 
+        keyframeTable = self.GetKeyframeTable(fcurve)
+
         self.IndentWrite(B"track: {\n")
         self.indentLevel += 1
 
@@ -1109,49 +2451,179 @@ class OpenGexExporter(bpy.types.Operator, ExportHelper):
             self.IndentWrite(B"time: {\n")
             self.indentLevel += 1
             self.IndentWrite(B"curve: \"linear\"\n")
-            self.ExportKeyTimes(fcurve)
+            self.ExportKeyTimes(keyframeTable)
             self.indentLevel -= 1
             self.IndentWrite(B"}\n")
 
             self.IndentWrite(B"value: {\n")
             self.indentLevel += 1
             self.IndentWrite(B"curve: \"linear\"\n")
-            self.ExportKeyValues(fcurve)
+            self.ExportKeyValues(keyframeTable)
             self.indentLevel -= 1
             self.IndentWrite(B"}\n")
         else:
             self.IndentWrite(B"time: {\n")
             self.indentLevel += 1
             self.IndentWrite(B"curve: \"bezier\"\n")
-            self.ExportKeyTimes(fcurve)
-            self.ExportKeyTimeControlPoints(fcurve)
+            self.ExportKeyTimes(keyframeTable)
+            self.ExportKeyTimeControlPoints(keyframeTable)
             self.indentLevel -= 1
             self.IndentWrite(B"}\n")
 
             self.IndentWrite(B"value: {\n")
             self.indentLevel += 1
             self.IndentWrite(B"curve: \"bezier\"\n")
-            self.ExportKeyValues(fcurve)
-            self.ExportKeyValueControlPoints(fcurve)
+            self.ExportKeyValues(keyframeTable)
+            self.ExportKeyValueControlPoints(keyframeTable)
             self.indentLevel -= 1
             self.IndentWrite(B"}\n")
 
         self.indentLevel -= 1
         self.IndentWrite(B"}\n")
 
+    @staticmethod
+    def QuantizeRange(values):
+
+        # This function maps each column of values onto the full range of an unsigned
+        # 16-bit integer. The minimum and maximum of each column are returned with the
+        # quantized values so that a loader can reconstruct min + q / 65535 * (max - min).
+
+        minimum = values.min(axis = 0)
+        maximum = values.max(axis = 0)
+        extent = maximum - minimum
+        scale = np.divide(65535.0, extent, out = np.zeros_like(extent), where = (extent > 0.0))
+        quantized = np.rint((values - minimum) * scale).astype(np.uint16)
+        return (minimum, maximum, quantized)
+
+    @staticmethod
+    def CompressQuaternions(quaternions):
+
+        # This function encodes rotations in 48 bits using the smallest-three method. The
+        # quaternions are given as (w, x, y, z) and written in the order x, y, z, w like
+        # WriteBoneQuaternion. The component with the largest magnitude is dropped after the
+        # quaternion is negated if necessary to make it positive, which leaves three values in
+        # [-1/sqrt(2), 1/sqrt(2)] that are quantized to 15 bits each. Each value is stored in
+        # the upper 15 bits of a u16, and the low bits of the first two u16 values hold the
+        # index (0 to 3, in x, y, z, w order) of the dropped component.
+
+        quaternions = quaternions[:, [1, 2, 3, 0]]
+        quaternions /= np.linalg.norm(quaternions, axis = 1, keepdims = True)
+        rowIndex = np.arange(len(quaternions))
+        largest = np.argmax(np.abs(quaternions), axis = 1)
+        quaternions *= np.where(quaternions[rowIndex, largest] < 0.0, -1.0, 1.0)[:, None]
+
+        keep = np.array([[1, 2, 3], [0, 2, 3], [0, 1, 3], [0, 1, 2]])[largest]
+        smallest = np.take_along_axis(quaternions, keep, axis = 1)
+        quantized = np.rint(np.clip((smallest * math.sqrt(2.0) + 1.0) * 0.5, 0.0, 1.0) * 32767.0).astype(np.uint16)
+
+        packed = quantized << 1
+        packed[:, 0] |= (largest & 1).astype(np.uint16)
+        packed[:, 1] |= (largest >> 1).astype(np.uint16)
+        return (packed)
+
+    def ExportCompressedTranslations(self, translations):
+        minimum, maximum, quantized = OpenGexExporter.QuantizeRange(translations)
+
+        self.IndentWrite(B"type: \"vec3_u16\"\n")
+        self.IndentWrite(B"range_min: ")
+        self.WriteBoneVector3D(minimum)
+        self.Write(B"\n")
+        self.IndentWrite(B"range_max: ")
+        self.WriteBoneVector3D(maximum)
+        self.Write(B"\n")
+        self.WriteArrayData(quantized.ravel(), B"u16", 3)
+
+    def ExportCompressedRotations(self, quaternions):
+        self.IndentWrite(B"type: \"quat48\"\n")
+        self.WriteArrayData(OpenGexExporter.CompressQuaternions(quaternions).ravel(), B"u16", 3)
+
+    @staticmethod
+    def LinearKeyError(interpolated, samples):
+        return (np.abs(interpolated - samples).max(axis = 1))
+
+    @staticmethod
+    def QuaternionKeyError(interpolated, samples):
+        # Angle between the normalized interpolated rotation and the sampled rotation.
+        interpolated = interpolated / np.linalg.norm(interpolated, axis = 1, keepdims = True)
+        dot = np.abs(np.sum(interpolated * samples, axis = 1))
+        return (2.0 * np.arccos(np.minimum(dot, 1.0)))
+
+    @staticmethod
+    def ReduceKeys(values, tolerance, errorFunction):
+
+        # This function removes samples that can be reconstructed by linear interpolation
+        # between the samples that are kept. Starting from the first sample, each segment is
+        # extended one sample at a time for as long as errorFunction stays within the
+        # tolerance for every sample it skips. The first and last samples are always kept.
+        # The indices of the kept samples are returned.
+
+        sampleCount = len(values)
+        if (sampleCount < 3):
+            return (list(range(sampleCount)))
+
+        keyArray = [0]
+        start = 0
+        end = 1
+        while (end < sampleCount - 1):
+            candidate = end + 1
+            t = (np.arange(start + 1, candidate) - start) / (candidate - start)
+            interpolated = values[start] + (values[candidate] - values[start]) * t[:, None]
+            if (errorFunction(interpolated, values[start + 1:candidate]).max() <= tolerance):
+                end = candidate
+            else:
+                keyArray.append(end)
+                start = end
+                end = start + 1
+
+        keyArray.append(sampleCount - 1)
+        return (keyArray)
+
+    def ExportSampledTime(self, keyArray):
+
+        # This function writes the time keys of a sampled track, given as indices of frames
+        # counted from the beginning of the scene's frame range. With a shared timeline, a
+        # track that keeps every frame refers to the timeline written at the top of the file,
+        # and a reduced track lists the indices of the frames that it keeps.
+
+        self.IndentWrite(B"time: {\n")
+        self.indentLevel += 1
+        self.IndentWrite(B"curve: \"linear\"\n")
+        self.IndentWrite(B"key: {\n")
+        self.indentLevel += 1
+        self.IndentWrite(B"kind: \"value\"\n")
+
+        if (self.option_shared_timeline):
+            if (len(keyArray) == self.endFrame - self.beginFrame + 1):
+                self.IndentWrite(B"type: \"timeline\"\n")
+            else:
+                self.IndentWrite(B"type: \"frame\"\n")
+                self.WriteArrayData(np.array(keyArray, dtype = np.uint32), B"u32")
+        else:
+            self.IndentWrite(B"type: \"float\"\n")
+            self.IndentWrite(B"data: [\n")
+            self.indentLevel += 1
+            self.WriteFloatArray([k * self.frameTime for k in keyArray])
+            self.indentLevel -= 1
+            self.IndentWrite(B"]\n")
+
+        self.indentLevel -= 1
+        self.IndentWrite(B"}\n")
+        self.indentLevel -= 1
+        self.IndentWrite(B"}\n")
+
+    @ProfiledSection
     def ExportNodeSampledAnimation(self, node, scene):
 
         # This function exports animation as full 4x4 matrices for each frame.
 
-        currentFrame = scene.frame_current
-        currentSubframe = scene.frame_subframe
+        samples = self.animationSampler.nodeSamples.get(node)
+        if (not samples):
+            return
 
+        m1, matrices = samples
         animationFlag = False
-        m1 = node.matrix_local.copy()
 
-        for i in range(self.beginFrame, self.endFrame):
-            scene.frame_set(i)
-            m2 = node.matrix_local
+        for m2 in matrices[:-1]:
             if (self.sampleAnimationFlag or OpenGexExporter.MatricesDifferent(m1, m2)):
                 animationFlag = True
                 break
@@ -1165,33 +2637,7 @@ class OpenGexExporter(bpy.types.Operator, ExportHelper):
 
             self.IndentWrite(B"target: \"transform\"\n")
 
-            self.IndentWrite(B"time: {\n")
-            self.indentLevel += 1
-            self.IndentWrite(B"curve: \"linear\"\n")
-            self.IndentWrite(B"key: {\n")
-            self.indentLevel += 1
-            self.IndentWrite(B"kind: \"value\"\n")
-            self.IndentWrite(B"type: \"float\"\n")
-            self.IndentWrite(B"data: [\n")
-            self.indentLevel += 1
-
-            self.IndentWrite(B"")
-            for i in range(self.beginFrame, self.endFrame + 1):
-                self.WriteFloat((i - self.beginFrame) * self.frameTime)
-                if i == self.endFrame:
-                    self.Write(B"\n")
-                    break
-                self.Write(B", ")
-                if not (i - self.beginFrame) % kOutputColumns:
-                    self.Write(B"\n")
-                    self.IndentWrite(B"")
-
-            self.indentLevel -= 1
-            self.IndentWrite(B"]\n")
-            self.indentLevel -= 1
-            self.IndentWrite(B"}\n")
-            self.indentLevel -= 1
-            self.IndentWrite(B"}\n")
+            self.ExportSampledTime(range(len(matrices)))
 
             self.IndentWrite(B"value: {\n")
             self.indentLevel += 1
@@ -1203,13 +2649,11 @@ class OpenGexExporter(bpy.types.Operator, ExportHelper):
             self.IndentWrite(B"data: [\n")
             self.indentLevel += 1
 
-            for i in range(self.beginFrame, self.endFrame):
-                scene.frame_set(i)
-                self.WriteMatrixFlat(node.matrix_local)
+            for matrix in matrices[:-1]:
+                self.WriteMatrixFlat(matrix)
                 self.Write(B",\n")
 
-            scene.frame_set(self.endFrame)
-            self.WriteMatrixFlat(node.matrix_local)
+            self.WriteMatrixFlat(matrices[-1])
 
             self.indentLevel -= 1
             self.IndentWrite(B"]\n")
@@ -1224,26 +2668,26 @@ class OpenGexExporter(bpy.types.Operator, ExportHelper):
             self.indentLevel -= 1
             self.IndentWrite(B"}\n")
 
-        scene.frame_set(currentFrame, subframe=currentSubframe)
-
+    @ProfiledSection
     def ExportBoneSampledAnimationTranslation(self, poseBone, action, scene):
 
         # This function exports bone animation translation as vec3 for each frame.
 
-        currentFrame = scene.frame_current
-        currentSubframe = scene.frame_subframe
+        samples = self.animationSampler.boneSamples.get((poseBone.id_data, poseBone.name, action))
+        if (not samples):
+            return
 
-        animationFlag = False
-        v1 = poseBone.matrix.translation.copy()
-
-        for i in range(self.beginFrame, self.endFrame):
-            scene.frame_set(i)
-            v2 = poseBone.matrix.translation
-            if (self.sampleAnimationFlag or OpenGexExporter.Vec3Different(v1, v2)):
-                animationFlag = True
-                break
+        restMatrix, matrices, translations, rotations = samples
+        animationFlag = (self.sampleAnimationFlag) and (len(matrices) > 1)
+        if (not animationFlag):
+            animationFlag = bool(np.any(np.abs(matrices[:-1, :3, 3] - restMatrix[:3, 3]) > kExportEpsilon))
 
         if (animationFlag):
+            translationArray = translations.tolist()
+            keyArray = range(len(translationArray))
+            if (self.option_reduce_keys):
+                keyArray = OpenGexExporter.ReduceKeys(np.array(translationArray), self.option_reduce_position_tolerance, OpenGexExporter.LinearKeyError)
+
             self.IndentWrite(B"animation: {  # ExportBoneSampledAnimationTranslation\n")
             self.indentLevel += 1
 
@@ -1251,39 +2695,12 @@ class OpenGexExporter(bpy.types.Operator, ExportHelper):
             self.WriteString(self.namespace + 'clip.' + action)
             self.Write(B"\n")
 
-            self.IndentWrite(B"track: {\n")
-            self.indentLevel += 1
-
-            self.IndentWrite(B"target: \"translation\"\n")
-
-            self.IndentWrite(B"time: {\n")
-            self.indentLevel += 1
-            self.IndentWrite(B"curve: \"linear\"\n")
-            self.IndentWrite(B"key: {\n")
-            self.indentLevel += 1
-            self.IndentWrite(B"kind: \"value\"\n")
-            self.IndentWrite(B"type: \"float\"\n")
-            self.IndentWrite(B"data: [\n")
-            self.indentLevel += 1
-
-            self.IndentWrite(B"")
-            for i in range(self.beginFrame, self.endFrame + 1):
-                self.WriteFloat((i - self.beginFrame) * self.frameTime)
-                if i == self.endFrame:
-                    self.Write(B"\n")
-                    break
-                self.Write(B", ")
-                idx = i - self.beginFrame
-                if idx and not (idx + 1) % kOutputColumns:
-                    self.Write(B"\n")
-                    self.IndentWrite(B"")
-
-            self.indentLevel -= 1
-            self.IndentWrite(B"]\n")
-            self.indentLevel -= 1
-            self.IndentWrite(B"}\n")
-            self.indentLevel -= 1
-            self.IndentWrite(B"}\n")
+            self.IndentWrite(B"track: {\n")
+            self.indentLevel += 1
+
+            self.IndentWrite(B"target: \"translation\"\n")
+
+            self.ExportSampledTime(keyArray)
 
             self.IndentWrite(B"value: {\n")
             self.indentLevel += 1
@@ -1291,39 +2708,38 @@ class OpenGexExporter(bpy.types.Operator, ExportHelper):
             self.IndentWrite(B"key: {\n")
             self.indentLevel += 1
             self.IndentWrite(B"kind: \"value\"\n")
-            self.IndentWrite(B"type: \"vec3\"\n")
-            self.IndentWrite(B"data: [\n")
-            self.indentLevel += 1
+            if (self.option_compress_tracks):
+                self.ExportCompressedTranslations(np.array([tuple(translationArray[k]) for k in keyArray], dtype = np.float64))
+            else:
+                self.IndentWrite(B"type: \"vec3\"\n")
+                self.IndentWrite(B"data: [\n")
+                self.indentLevel += 1
 
-            # BONESTUFF
-            # for i in range(self.beginFrame, self.endFrame):
-            #     scene.frame_set(i)
-            #     self.IndentWrite(B"")
-            #     par_mat_inv = poseBone.bone.parent.matrix_local.inverted_safe() if poseBone.bone.parent else worldToBoneSpace
-            #     self.WriteBoneVector3D((par_mat_inv @ poseBone.bone.matrix_local @ poseBone.matrix_basis).translation)
-            #     self.Write(B",\n")
-
-            # scene.frame_set(self.endFrame)
-            # self.IndentWrite(B"")
-            # par_mat_inv = poseBone.bone.parent.matrix_local.inverted_safe() if poseBone.bone.parent else worldToBoneSpace
-            # self.WriteBoneVector3D((par_mat_inv @ poseBone.bone.matrix_local @ poseBone.matrix_basis).translation)
-            # self.Write(B"\n")
-
-            for i in range(self.beginFrame, self.endFrame):
-                scene.frame_set(i)
-                self.IndentWrite(B"")
-                par_mat_inv = poseBone.parent.matrix.inverted_safe() if poseBone.bone.parent else worldToBoneSpace
-                self.WriteBoneVector3D((par_mat_inv @ poseBone.matrix).translation)
-                self.Write(B",\n")
+                # BONESTUFF
+                # for i in range(self.beginFrame, self.endFrame):
+                #     scene.frame_set(i)
+                #     self.IndentWrite(B"")
+                #     par_mat_inv = poseBone.bone.parent.matrix_local.inverted_safe() if poseBone.bone.parent else worldToBoneSpace
+                #     self.WriteBoneVector3D((par_mat_inv @ poseBone.bone.matrix_local @ poseBone.matrix_basis).translation)
+                #     self.Write(B",\n")
+
+                # scene.frame_set(self.endFrame)
+                # self.IndentWrite(B"")
+                # par_mat_inv = poseBone.bone.parent.matrix_local.inverted_safe() if poseBone.bone.parent else worldToBoneSpace
+                # self.WriteBoneVector3D((par_mat_inv @ poseBone.bone.matrix_local @ poseBone.matrix_basis).translation)
+                # self.Write(B"\n")
+
+                for k in keyArray[:-1]:
+                    self.IndentWrite(B"")
+                    self.WriteBoneVector3D(translationArray[k])
+                    self.Write(B",\n")
 
-            scene.frame_set(self.endFrame)
-            self.IndentWrite(B"")
-            par_mat_inv = poseBone.parent.matrix.inverted_safe() if poseBone.bone.parent else worldToBoneSpace
-            self.WriteBoneVector3D((par_mat_inv @ poseBone.matrix).translation)
-            self.Write(B"\n")
+                self.IndentWrite(B"")
+                self.WriteBoneVector3D(translationArray[keyArray[-1]])
+                self.Write(B"\n")
 
-            self.indentLevel -= 1
-            self.IndentWrite(B"]\n")
+                self.indentLevel -= 1
+                self.IndentWrite(B"]\n")
             self.indentLevel -= 1
             self.IndentWrite(B"}\n")
             self.indentLevel -= 1
@@ -1335,26 +2751,35 @@ class OpenGexExporter(bpy.types.Operator, ExportHelper):
             self.indentLevel -= 1
             self.IndentWrite(B"}\n")
 
-        scene.frame_set(currentFrame, subframe=currentSubframe)
-
+    @ProfiledSection
     def ExportBoneSampledAnimationRotation(self, poseBone, action, scene):
 
         # This function exports bone animation translation as vec4 (quaternion) for each frame.
 
-        currentFrame = scene.frame_current
-        currentSubframe = scene.frame_subframe
-
-        animationFlag = False
-        v1 = poseBone.matrix.to_quaternion()
+        samples = self.animationSampler.boneSamples.get((poseBone.id_data, poseBone.name, action))
+        if (not samples):
+            return
 
-        for i in range(self.beginFrame, self.endFrame):
-            scene.frame_set(i)
-            v2 = poseBone.matrix.to_quaternion()
-            if (self.sampleAnimationFlag or OpenGexExporter.Vec4Different(v1, v2)):
-                animationFlag = True
-                break
+        restMatrix, matrices, translations, rotations = samples
+        animationFlag = (self.sampleAnimationFlag) and (len(matrices) > 1)
+        if (not animationFlag):
+            animationFlag = bool(np.any(np.abs(AnimationSampler.MatrixToQuaternion(matrices[:-1]) - AnimationSampler.MatrixToQuaternion(restMatrix)) > kExportEpsilon))
 
         if (animationFlag):
+            rotationArray = rotations.tolist()
+            keyArray = range(len(rotationArray))
+            if (self.option_reduce_keys):
+
+                # Keep consecutive quaternions in the same hemisphere so that the reduced
+                # track interpolates along the short path between the remaining keys.
+
+                quaternions = np.array([tuple(q) for q in rotationArray], dtype = np.float64)
+                quaternions /= np.linalg.norm(quaternions, axis = 1, keepdims = True)
+                flip = np.cumsum(np.sum(quaternions[1:] * quaternions[:-1], axis = 1) < 0.0) % 2
+                quaternions[1:][flip == 1] *= -1.0
+                keyArray = OpenGexExporter.ReduceKeys(quaternions, self.option_reduce_rotation_tolerance, OpenGexExporter.QuaternionKeyError)
+                rotationArray = quaternions.tolist()
+
             self.IndentWrite(B"animation: {  # ExportBoneSampledAnimationRotation\n")
             self.indentLevel += 1
 
@@ -1367,34 +2792,7 @@ class OpenGexExporter(bpy.types.Operator, ExportHelper):
 
             self.IndentWrite(B"target: \"rotation\"\n")
 
-            self.IndentWrite(B"time: {\n")
-            self.indentLevel += 1
-            self.IndentWrite(B"curve: \"linear\"\n")
-            self.IndentWrite(B"key: {\n")
-            self.indentLevel += 1
-            self.IndentWrite(B"kind: \"value\"\n")
-            self.IndentWrite(B"type: \"float\"\n")
-            self.IndentWrite(B"data: [\n")
-            self.indentLevel += 1
-
-            self.IndentWrite(B"")
-            for i in range(self.beginFrame, self.endFrame + 1):
-                self.WriteFloat((i - self.beginFrame) * self.frameTime)
-                if i == self.endFrame:
-                    self.Write(B"\n")
-                    break
-                self.Write(B", ")
-                idx = i - self.beginFrame
-                if idx and not (idx + 1) % kOutputColumns:
-                    self.Write(B"\n")
-                    self.IndentWrite(B"")
-
-            self.indentLevel -= 1
-            self.IndentWrite(B"]\n")
-            self.indentLevel -= 1
-            self.IndentWrite(B"}\n")
-            self.indentLevel -= 1
-            self.IndentWrite(B"}\n")
+            self.ExportSampledTime(keyArray)
 
             self.IndentWrite(B"value: {\n")
             self.indentLevel += 1
@@ -1402,71 +2800,71 @@ class OpenGexExporter(bpy.types.Operator, ExportHelper):
             self.IndentWrite(B"key: {\n")
             self.indentLevel += 1
             self.IndentWrite(B"kind: \"value\"\n")
-            self.IndentWrite(B"type: \"vec4\"\n")
-            self.IndentWrite(B"data: [\n")
-            self.indentLevel += 1
+            if (self.option_compress_tracks):
+                self.ExportCompressedRotations(np.array([tuple(rotationArray[k]) for k in keyArray], dtype = np.float64))
+            else:
+                self.IndentWrite(B"type: \"vec4\"\n")
+                self.IndentWrite(B"data: [\n")
+                self.indentLevel += 1
 
-            # parent = poseBone.parent
-            # if (parent):
-            #     for i in range(self.beginFrame, self.endFrame + 1):
-            #         scene.frame_set(i)
-            #         if (math.fabs(parent.matrix.determinant()) > kExportEpsilon):
-            #             self.IndentWrite(B"")
-            #             self.WriteBoneQuaternion((parent.matrix.inverted() @ poseBone.matrix).to_quaternion())
-            #         else:
-            #             self.IndentWrite(B"")
-            #             self.WriteBoneQuaternion(poseBone.matrix.to_quaternion())
-
-            #         if i == self.endFrame:
-            #             self.Write(B"\n")
-            #             break
-
-            #         self.Write(B",\n")
-
-            # else:
-            #     for i in range(self.beginFrame, self.endFrame):
-            #         scene.frame_set(i)
-            #         self.IndentWrite(B"")
-            #         self.WriteBoneQuaternion(poseBone.matrix.to_quaternion())
-            #         self.Write(B",\n")
-
-            #     scene.frame_set(self.endFrame)
-            #     self.IndentWrite(B"")
-            #     self.WriteBoneQuaternion(poseBone.matrix.to_quaternion())
-            #     self.Write(B"\n")
-
-            #----------------------------------------------------------------
-
-            # for i in range(self.beginFrame, self.endFrame):
-            #     scene.frame_set(i)
-            #     self.IndentWrite(B"")
-            #     self.WriteQuaternion(poseBone.matrix_basis.to_quaternion())
-            #     self.Write(B",\n")
-
-            # scene.frame_set(self.endFrame)
-            # self.IndentWrite(B"")
-            # self.WriteQuaternion(poseBone.matrix_basis.to_quaternion())
-            # self.Write(B"\n")
-
-            #----------------------------------------------------------------
+                # parent = poseBone.parent
+                # if (parent):
+                #     for i in range(self.beginFrame, self.endFrame + 1):
+                #         scene.frame_set(i)
+                #         if (math.fabs(parent.matrix.determinant()) > kExportEpsilon):
+                #             self.IndentWrite(B"")
+                #             self.WriteBoneQuaternion((parent.matrix.inverted() @ poseBone.matrix).to_quaternion())
+                #         else:
+                #             self.IndentWrite(B"")
+                #             self.WriteBoneQuaternion(poseBone.matrix.to_quaternion())
+
+                #         if i == self.endFrame:
+                #             self.Write(B"\n")
+                #             break
+
+                #         self.Write(B",\n")
+
+                # else:
+                #     for i in range(self.beginFrame, self.endFrame):
+                #         scene.frame_set(i)
+                #         self.IndentWrite(B"")
+                #         self.WriteBoneQuaternion(poseBone.matrix.to_quaternion())
+                #         self.Write(B",\n")
+
+                #     scene.frame_set(self.endFrame)
+                #     self.IndentWrite(B"")
+                #     self.WriteBoneQuaternion(poseBone.matrix.to_quaternion())
+                #     self.Write(B"\n")
+
+                #----------------------------------------------------------------
+
+                # for i in range(self.beginFrame, self.endFrame):
+                #     scene.frame_set(i)
+                #     self.IndentWrite(B"")
+                #     self.WriteQuaternion(poseBone.matrix_basis.to_quaternion())
+                #     self.Write(B",\n")
+
+                # scene.frame_set(self.endFrame)
+                # self.IndentWrite(B"")
+                # self.WriteQuaternion(poseBone.matrix_basis.to_quaternion())
+                # self.Write(B"\n")
+
+                #----------------------------------------------------------------
+
+                # BONESTUFF
+                for k in keyArray[:-1]:
+                    self.IndentWrite(B"")
+                    self.WriteBoneQuaternion(rotationArray[k])
+                    self.Write(B",\n")
 
-            # BONESTUFF
-            for i in range(self.beginFrame, self.endFrame):
-                scene.frame_set(i)
                 self.IndentWrite(B"")
-                par_mat_inv = poseBone.parent.matrix.inverted_safe() if poseBone.parent else worldToBoneSpace
-                self.WriteBoneQuaternion((par_mat_inv @ poseBone.matrix).to_quaternion())
-                self.Write(B",\n")
-
-            scene.frame_set(self.endFrame)
-            self.IndentWrite(B"")
-            self.WriteBoneQuaternion((par_mat_inv @ poseBone.matrix).to_quaternion())
-            self.Write(B"\n")
+                self.WriteBoneQuaternion(rotationArray[keyArray[-1]])
+                self.Write(B"\n")
 
-            #-----------------------------------------------------------------
+                #-----------------------------------------------------------------
 
-            self.indentLevel -= 1
-            self.IndentWrite(B"]\n")
+                self.indentLevel -= 1
+                self.IndentWrite(B"]\n")
             self.indentLevel -= 1
             self.IndentWrite(B"}\n")
             self.indentLevel -= 1
@@ -1478,11 +2876,12 @@ class OpenGexExporter(bpy.types.Operator, ExportHelper):
             self.indentLevel -= 1
             self.IndentWrite(B"}\n")
 
-        scene.frame_set(currentFrame, subframe=currentSubframe)
-
+    @ProfiledSection
     def ExportMorphWeightSampledAnimationTrack(self, block, target, target_index, scene, newline):
-        currentFrame = scene.frame_current
-        currentSubframe = scene.frame_subframe
+        values = self.animationSampler.morphSamples[block]
+        keyArray = range(len(values))
+        if (self.option_reduce_keys):
+            keyArray = OpenGexExporter.ReduceKeys(np.array(values)[:, None], self.option_reduce_weight_tolerance, OpenGexExporter.LinearKeyError)
 
         self.IndentWrite(B"track: {\n")
         self.indentLevel += 1
@@ -1495,34 +2894,7 @@ class OpenGexExporter(bpy.types.Operator, ExportHelper):
         self.WriteInt(target_index)
         self.Write(B"\n")
 
-        self.IndentWrite(B"time: {\n")
-        self.indentLevel += 1
-        self.IndentWrite(B"curve: \"linear\"\n")
-        self.IndentWrite(B"key: {\n")
-        self.indentLevel += 1
-        self.IndentWrite(B"kind: \"value\"\n")
-        self.IndentWrite(B"type: \"float\"\n")
-        self.IndentWrite(B"data: [\n")
-        self.indentLevel += 1
-
-        self.IndentWrite(B"")
-        for i in range(self.beginFrame, self.endFrame + 1):
-            self.WriteFloat((i - self.beginFrame) * self.frameTime)
-            if i == self.endFrame:
-                self.Write(B"\n")
-                break
-            self.Write(B", ")
-            idx = i - self.beginFrame
-            if idx and not (idx + 1) % kOutputColumns:
-                self.Write(B"\n")
-                self.IndentWrite(B"")
-
-        self.indentLevel -= 1
-        self.IndentWrite(B"]\n")
-        self.indentLevel -= 1
-        self.IndentWrite(B"}\n")
-        self.indentLevel -= 1
-        self.IndentWrite(B"}\n")
+        self.ExportSampledTime(keyArray)
 
         self.IndentWrite(B"value: {\n")
         self.indentLevel += 1
@@ -1534,18 +2906,7 @@ class OpenGexExporter(bpy.types.Operator, ExportHelper):
         self.IndentWrite(B"data: [\n")
         self.indentLevel += 1
 
-        self.IndentWrite(B"")
-        for i in range(self.beginFrame, self.endFrame + 1):
-            scene.frame_set(i)
-            self.WriteFloat(block.value)
-            if i == self.endFrame:
-                self.Write(B"\n")
-                break
-            self.Write(B", ")
-            idx = i - self.beginFrame
-            if idx and not (idx + 1) % kOutputColumns:
-                self.Write(B"\n")
-                self.IndentWrite(B"")
+        self.WriteFloatArray([values[k] for k in keyArray])
 
         self.indentLevel -= 1
         self.IndentWrite(B"]\n")
@@ -1557,8 +2918,6 @@ class OpenGexExporter(bpy.types.Operator, ExportHelper):
         self.indentLevel -= 1
         self.IndentWrite(B"}\n")
 
-        scene.frame_set(currentFrame, subframe=currentSubframe)
-
     def ExportNodeTransform(self, node, scene, poseBone):
         posAnimCurve = [None, None, None]
         rotAnimCurve = [None, None, None]
@@ -1595,49 +2954,50 @@ class OpenGexExporter(bpy.types.Operator, ExportHelper):
             action = node.animation_data.action
             if (action):
                 for fcurve in action.fcurves:
-                    kind = OpenGexExporter.ClassifyAnimationCurve(fcurve)
+                    keyframeTable = self.GetKeyframeTable(fcurve)
+                    kind = OpenGexExporter.ClassifyAnimationCurve(keyframeTable)
                     if (kind != kAnimationSampled):
                         if (fcurve.data_path == "location"):
                             for i in range(3):
                                 if ((fcurve.array_index == i) and (not posAnimCurve[i])):
                                     posAnimCurve[i] = fcurve
                                     posAnimKind[i] = kind
-                                    if (OpenGexExporter.AnimationPresent(fcurve, kind)):
+                                    if (OpenGexExporter.AnimationPresent(keyframeTable, kind)):
                                         posAnimated[i] = True
                         elif (fcurve.data_path == "delta_location"):
                             for i in range(3):
                                 if ((fcurve.array_index == i) and (not deltaPosAnimCurve[i])):
                                     deltaPosAnimCurve[i] = fcurve
                                     deltaPosAnimKind[i] = kind
-                                    if (OpenGexExporter.AnimationPresent(fcurve, kind)):
+                                    if (OpenGexExporter.AnimationPresent(keyframeTable, kind)):
                                         deltaPosAnimated[i] = True
                         elif (fcurve.data_path == "rotation_euler"):
                             for i in range(3):
                                 if ((fcurve.array_index == i) and (not rotAnimCurve[i])):
                                     rotAnimCurve[i] = fcurve
                                     rotAnimKind[i] = kind
-                                    if (OpenGexExporter.AnimationPresent(fcurve, kind)):
+                                    if (OpenGexExporter.AnimationPresent(keyframeTable, kind)):
                                         rotAnimated[i] = True
                         elif (fcurve.data_path == "delta_rotation_euler"):
                             for i in range(3):
                                 if ((fcurve.array_index == i) and (not deltaRotAnimCurve[i])):
                                     deltaRotAnimCurve[i] = fcurve
                                     deltaRotAnimKind[i] = kind
-                                    if (OpenGexExporter.AnimationPresent(fcurve, kind)):
+                                    if (OpenGexExporter.AnimationPresent(keyframeTable, kind)):
                                         deltaRotAnimated[i] = True
                         elif (fcurve.data_path == "scale"):
                             for i in range(3):
                                 if ((fcurve.array_index == i) and (not sclAnimCurve[i])):
                                     sclAnimCurve[i] = fcurve
                                     sclAnimKind[i] = kind
-                                    if (OpenGexExporter.AnimationPresent(fcurve, kind)):
+                                    if (OpenGexExporter.AnimationPresent(keyframeTable, kind)):
                                         sclAnimated[i] = True
                         elif (fcurve.data_path == "delta_scale"):
                             for i in range(3):
                                 if ((fcurve.array_index == i) and (not deltaSclAnimCurve[i])):
                                     deltaSclAnimCurve[i] = fcurve
                                     deltaSclAnimKind[i] = kind
-                                    if (OpenGexExporter.AnimationPresent(fcurve, kind)):
+                                    if (OpenGexExporter.AnimationPresent(keyframeTable, kind)):
                                         deltaSclAnimated[i] = True
                         elif ((fcurve.data_path == "rotation_axis_angle") or (fcurve.data_path == "rotation_quaternion") or (fcurve.data_path == "delta_rotation_quaternion")):
                             sampledAnimation = True
@@ -2038,6 +3398,7 @@ class OpenGexExporter(bpy.types.Operator, ExportHelper):
     #             self.ExportBoneSampledAnimationTranslation(poseBone, action, scene)
     #             self.ExportBoneSampledAnimationRotation(poseBone, action, scene)
 
+    @ProfiledSection
     def ExportBoneTransform(self, armature, bone, scene):
         # BONESTUFF
         poseBone = armature.pose.bones.get(bone.name)
@@ -2069,9 +3430,8 @@ class OpenGexExporter(bpy.types.Operator, ExportHelper):
         self.Write(B"\n")
 
         if (poseBone):
-            actions = self.CollectBoneActions(bone.name)
+            actions = self.actionIndex.BoneActions(bone.name)
             for action in actions:
-                armature.animation_data.action = bpy.data.actions.get(action)
                 self.ExportBoneSampledAnimationTranslation(poseBone, action, scene)
                 self.ExportBoneSampledAnimationRotation(poseBone, action, scene)
 
@@ -2161,7 +3521,7 @@ class OpenGexExporter(bpy.types.Operator, ExportHelper):
                 target = "morph_weight"
 
                 fcurve = curveArray[a]
-                kind = OpenGexExporter.ClassifyAnimationCurve(fcurve)
+                kind = OpenGexExporter.ClassifyAnimationCurve(self.GetKeyframeTable(fcurve))
                 if ((kind != kAnimationSampled) and (not self.sampleAnimationFlag)):
                     self.ExportAnimationTrack(fcurve, kind, target, k, structFlag)
                 else:
@@ -2205,6 +3565,7 @@ class OpenGexExporter(bpy.types.Operator, ExportHelper):
             self.indentLevel -= 1
             self.IndentWrite(B"}\n")
 
+    @ProfiledSection
     def ExportNode(self, node, scene, poseBone = None):
         # This function exports a single node in the scene and includes its name,
         # object reference, material references (for geometries), and transform.
@@ -2302,7 +3663,8 @@ class OpenGexExporter(bpy.types.Operator, ExportHelper):
             self.indentLevel -= 1
             self.IndentWrite(B"}\n")
 
-    def ExportSkin(self, node, armature, exportVertexArray):
+    @ProfiledSection
+    def ExportSkin(self, node, armature, exportVertexTable):
         # This function exports all skinning data, which includes the skeleton
         # and per-vertex bone influence data.
 
@@ -2417,10 +3779,10 @@ class OpenGexExporter(bpy.types.Operator, ExportHelper):
         boneWeightArray = []
 
         meshVertexArray = node.data.vertices
-        for ev in exportVertexArray:
+        for vertexIndex in exportVertexTable.vertexIndex.tolist():
             boneCount = 0
             totalWeight = 0.0
-            for element in meshVertexArray[ev.vertexIndex].groups:
+            for element in meshVertexArray[vertexIndex].groups:
                 boneIndex = groupRemap[element.group]
                 boneWeight = element.weight
                 if ((boneIndex >= 0) and (boneWeight != 0.0)):
@@ -2435,6 +3797,14 @@ class OpenGexExporter(bpy.types.Operator, ExportHelper):
                 for i in range(-boneCount, 0):
                     boneWeightArray[i] *= normalizer
 
+        if (self.binaryFile):
+            self.ExportSkinBinaryArray(B"bone_count_array", boneCountArray, B"u16")
+            self.ExportSkinBinaryArray(B"bone_index_array", boneIndexArray, B"u16")
+            self.ExportSkinBinaryArray(B"bone_weight_array", np.array(boneWeightArray, dtype = np.float32), B"float")
+            self.indentLevel -= 1
+            self.IndentWrite(B"}\n")
+            return
+
         # Write the bone count array. There is one entry per vertex.
 
         self.IndentWrite(B"bone_count_array: [  # u16[")
@@ -2474,6 +3844,17 @@ class OpenGexExporter(bpy.types.Operator, ExportHelper):
         self.indentLevel -= 1
         self.IndentWrite(B"}\n")
 
+    def ExportSkinBinaryArray(self, name, valueArray, type):
+        self.IndentWrite(name)
+        self.Write(B": ")
+        self.WriteBinaryReference(valueArray, type)
+        self.Write(B"  # ")
+        self.Write(type)
+        self.Write(B"[")
+        self.WriteInt(len(valueArray))
+        self.Write(B"]\n")
+
+    @ProfiledSection
     def ExportGeometry(self, objectRef, scene):
         # This function exports a single geometry object.
 
@@ -2574,13 +3955,34 @@ class OpenGexExporter(bpy.types.Operator, ExportHelper):
 
         # Triangulate mesh and remap vertices to eliminate duplicates.
 
-        materialTable = []
-        exportVertexArray = OpenGexExporter.DeindexMesh(exportMesh, materialTable)
+        with self.profiler.Section("DeindexMesh"):
+            exportVertexTable, materialTable = OpenGexExporter.DeindexMesh(exportMesh)
         triangleCount = len(materialTable)
 
-        indexTable = []
-        unifiedVertexArray = OpenGexExporter.UnifyVertices(exportVertexArray, indexTable)
-        vertexCount = len(unifiedVertexArray)
+        unifyVertexTable = exportVertexTable
+        if (self.option_weld_vertices):
+            unifyVertexTable = exportVertexTable.Quantize(self.option_weld_position, self.option_weld_normal, self.option_weld_normal, self.option_weld_color, self.option_weld_texcoord)
+
+        with self.profiler.Section("UnifyVertices"):
+            if (self.option_vertex_unify == "HASH"):
+                unifiedVertexTable, indexTable = OpenGexExporter.UnifyVertices(unifyVertexTable)
+            else:
+                unifiedVertexTable, indexTable = OpenGexExporter.SortUnifyVertices(unifyVertexTable)
+
+            # Welded vertices are written with the original attributes of the first corner
+            # merged into them, not the snapped ones, so normals and tangents stay unit length
+            # and positions don't move. Unified vertices are numbered in order of their first
+            # corner, so those corners are where each index first appears in the index table.
+
+            if (unifyVertexTable is not exportVertexTable):
+                firstCorner = np.unique(indexTable, return_index = True)[1]
+                unifiedVertexTable = exportVertexTable.Select(firstCorner)
+
+        submeshArray = OpenGexExporter.PartitionTriangles(materialTable, indexTable)
+        if (self.option_optimize_vertex_cache):
+            with self.profiler.Section("OptimizeVertexCache"):
+                unifiedVertexTable, submeshArray = OpenGexExporter.OptimizeVertexCache(unifiedVertexTable, submeshArray)
+        vertexCount = len(unifiedVertexTable)
 
         # Write the position array.
 
@@ -2589,11 +3991,7 @@ class OpenGexExporter(bpy.types.Operator, ExportHelper):
         self.Write(B"]\n")
         self.indentLevel += 1
         self.IndentWrite(B"attrib: \"position\"\n")
-        self.IndentWrite(B"data: [\n")
-        self.indentLevel += 1
-        self.WriteVertexArray3D(unifiedVertexArray, "position")
-        self.indentLevel -= 1
-        self.IndentWrite(B"]\n")
+        self.WriteVertexArray3D(unifiedVertexTable, "position")
         self.indentLevel -= 1
         self.IndentWrite(B"}\n")
 
@@ -2604,11 +4002,7 @@ class OpenGexExporter(bpy.types.Operator, ExportHelper):
         self.Write(B"]\n")
         self.indentLevel += 1
         self.IndentWrite(B"attrib: \"normal\"\n")
-        self.IndentWrite(B"data: [\n")
-        self.indentLevel += 1
-        self.WriteVertexArray3D(unifiedVertexArray, "normal")
-        self.indentLevel -= 1
-        self.IndentWrite(B"]\n")
+        self.WriteVertexArray3D(unifiedVertexTable, "normal")
         self.indentLevel -= 1
         self.IndentWrite(B"}\n")
 
@@ -2619,11 +4013,7 @@ class OpenGexExporter(bpy.types.Operator, ExportHelper):
         self.Write(B"]\n")
         self.indentLevel += 1
         self.IndentWrite(B"attrib: \"tangent\"\n")
-        self.IndentWrite(B"data: [\n")
-        self.indentLevel += 1
-        self.WriteVertexArray3D(unifiedVertexArray, "tangent")
-        self.indentLevel -= 1
-        self.IndentWrite(B"]\n")
+        self.WriteVertexArray3D(unifiedVertexTable, "tangent")
         self.indentLevel -= 1
         self.IndentWrite(B"}\n")
 
@@ -2636,11 +4026,7 @@ class OpenGexExporter(bpy.types.Operator, ExportHelper):
             self.Write(B"]\n")
             self.indentLevel += 1
             self.IndentWrite(B"attrib: \"color\"\n")
-            self.IndentWrite(B"data: [\n")
-            self.indentLevel += 1
-            self.WriteVertexArray3D(unifiedVertexArray, "color")
-            self.indentLevel -= 1
-            self.IndentWrite(B"]\n")
+            self.WriteVertexArray3D(unifiedVertexTable, "color")
             self.indentLevel -= 1
             self.IndentWrite(B"}\n")
 
@@ -2653,11 +4039,7 @@ class OpenGexExporter(bpy.types.Operator, ExportHelper):
             self.Write(B"]\n")
             self.indentLevel += 1
             self.IndentWrite(B"attrib: \"texcoord0\"\n")
-            self.IndentWrite(B"data: [\n")
-            self.indentLevel += 1
-            self.WriteVertexArray2D(unifiedVertexArray, "texcoord0")
-            self.indentLevel -= 1
-            self.IndentWrite(B"]\n")
+            self.WriteVertexArray2D(unifiedVertexTable, "texcoord0")
             self.indentLevel -= 1
             self.IndentWrite(B"}\n")
 
@@ -2667,11 +4049,7 @@ class OpenGexExporter(bpy.types.Operator, ExportHelper):
                 self.Write(B"]\n")
                 self.indentLevel += 1
                 self.IndentWrite(B"attrib: \"texcoord1\"\n")
-                self.IndentWrite(B"data: [\n")
-                self.indentLevel += 1
-                self.WriteVertexArray2D(unifiedVertexArray, "texcoord1")
-                self.indentLevel -= 1
-                self.IndentWrite(B"]\n")
+                self.WriteVertexArray2D(unifiedVertexTable, "texcoord1")
                 self.indentLevel -= 1
                 self.IndentWrite(B"}\n")
 
@@ -2711,11 +4089,7 @@ class OpenGexExporter(bpy.types.Operator, ExportHelper):
                 #self.WriteString(shapeKeys.key_blocks[m].name)
                 self.Write(B"\n")
                 self.IndentWrite(B"attrib: \"position\"\n")
-                self.IndentWrite(B"data: [\n")
-                self.indentLevel += 1
-                self.WriteMorphPositionArray3D(unifiedVertexArray, morphMesh.vertices)
-                self.indentLevel -= 1
-                self.IndentWrite(B"]\n")
+                self.WriteMorphPositionArray3D(unifiedVertexTable, morphMesh.vertices)
                 self.indentLevel -= 1
                 self.IndentWrite(B"}\n")
 
@@ -2731,11 +4105,7 @@ class OpenGexExporter(bpy.types.Operator, ExportHelper):
                 #self.WriteString(shapeKeys.key_blocks[m].name)
                 self.Write(B"\n")
                 self.IndentWrite(B"attrib: \"normal\"\n")
-                self.IndentWrite(B"data: [\n")
-                self.indentLevel += 1
-                self.WriteMorphNormalArray3D(unifiedVertexArray, morphMesh.vertices, morphMesh.loop_triangles)
-                self.indentLevel -= 1
-                self.IndentWrite(B"]\n")
+                self.WriteMorphNormalArray3D(unifiedVertexTable, morphMesh.vertices, morphMesh.loop_triangles)
                 self.indentLevel -= 1
                 self.IndentWrite(B"}\n")
 
@@ -2751,11 +4121,7 @@ class OpenGexExporter(bpy.types.Operator, ExportHelper):
                 #self.WriteString(shapeKeys.key_blocks[m].name)
                 self.Write(B"\n")
                 self.IndentWrite(B"attrib: \"tangent\"\n")
-                self.IndentWrite(B"data: [\n")
-                self.indentLevel += 1
-                self.WriteMorphTangentArray3D(unifiedVertexArray, morphMesh, morphMesh.vertices, morphMesh.loop_triangles)
-                self.indentLevel -= 1
-                self.IndentWrite(B"]\n")
+                self.WriteMorphTangentArray3D(unifiedVertexTable, morphMesh, morphMesh.vertices, morphMesh.loop_triangles)
                 self.indentLevel -= 1
                 self.IndentWrite(B"}\n")
 
@@ -2765,41 +4131,28 @@ class OpenGexExporter(bpy.types.Operator, ExportHelper):
         #self.IndentWrite(B"index_arrays: [\n")
         #self.indentLevel += 1
 
-        # Write the index arrays.
-        maxMaterialIndex = 0
-        for i in range(len(materialTable)):
-            index = materialTable[i]
-            if (index > maxMaterialIndex):
-                maxMaterialIndex = index
-
-        # If there are multiple material indexes, then write a separate index array for each one.
-        materialTriangleCount = [0 for i in range(maxMaterialIndex + 1)]
-        for i in range(len(materialTable)):
-            materialTriangleCount[materialTable[i]] += 1
-
-        for m in range(maxMaterialIndex + 1):
-            if (materialTriangleCount[m] != 0):
-                materialIndexTable = []
-                for i in range(len(materialTable)):
-                    if (materialTable[i] == m):
-                        k = i * 3
-                        materialIndexTable.append(indexTable[k])
-                        materialIndexTable.append(indexTable[k + 1])
-                        materialIndexTable.append(indexTable[k + 2])
-
-                self.IndentWrite(B"index_array: {  # u32[")
-                self.WriteInt(materialTriangleCount[m] * 3)
+        # Write the index arrays. If there are multiple material indexes, then write a separate index array for each one.
+
+        for materialIndex, triangleIndexArray in submeshArray:
+            for baseVertex, vertexCount, type, chunkIndexArray in OpenGexExporter.SplitIndexArray(triangleIndexArray, self.option_split_index_arrays):
+                self.IndentWrite(B"index_array: {  # ")
+                self.Write(type)
+                self.Write(B"[")
+                self.WriteInt(chunkIndexArray.size)
                 self.Write(B"]\n")
                 self.indentLevel += 1
                 self.IndentWrite(B"material_slot: ")
                 #self.WriteString(bpy.data.materials[m].name)
-                self.WriteInt(m)
+                self.WriteInt(materialIndex)
                 self.Write(B"\n")
-                self.IndentWrite(B"data: [\n")
-                self.indentLevel += 1
-                self.WriteTriangleArray(materialTriangleCount[m], materialIndexTable)
-                self.indentLevel -= 1
-                self.IndentWrite(B"]\n")
+                if (baseVertex != 0):
+                    self.IndentWrite(B"base_vertex: ")
+                    self.WriteInt(baseVertex)
+                    self.Write(B"\n")
+                    self.IndentWrite(B"vertex_count: ")
+                    self.WriteInt(vertexCount)
+                    self.Write(B"\n")
+                self.WriteTriangleArray(len(chunkIndexArray), (chunkIndexArray - baseVertex).ravel(), type)
                 self.indentLevel -= 1
                 self.IndentWrite(B"}\n")
 
@@ -2808,7 +4161,7 @@ class OpenGexExporter(bpy.types.Operator, ExportHelper):
 
         # If the mesh is skinned, export the skinning data here.
         if (armature):
-            self.ExportSkin(node, armature, unifiedVertexArray)
+            self.ExportSkin(node, armature, unifiedVertexTable)
 
         # Restore the morph state.
         if (shapeKeys):
@@ -2994,6 +4347,7 @@ class OpenGexExporter(bpy.types.Operator, ExportHelper):
         self.indentLevel -= 1
         self.IndentWrite(B"}\n")
 
+    @ProfiledSection
     def ExportObjects(self, scene):
         for objectRef in self.geometryArray.items():
             print(f"Exporting geometry {objectRef[0]}")
@@ -3005,21 +4359,60 @@ class OpenGexExporter(bpy.types.Operator, ExportHelper):
             print(f"Exporting camera {objectRef[0]}")
             self.ExportCamera(objectRef)
 
+    def SubmitFileWrite(self, function, *args):
+        if (self.filePool):
+            self.filePool.Submit(function, *args)
+        else:
+            function(*args)
+
+    @ProfiledSection
     def ExportTexture(self, texture, attrib):
+
+        # This function exports a single texture from a material and returns the name that the
+        # material refers to it by. Textures are identified by their source images and channel
+        # layout, so a texture shared by many materials is encoded and written only once. A
+        # different texture whose name is already taken gets a numbered name.
+
+        key = texture.key()
+        textureRef = self.textureArray.get(key)
+        if (textureRef):
+            return (textureRef["name"])
+
+        name = texture.name(self.namespace)
         filename = texture.filename(self.namespace)
+        base, extension = os.path.splitext(filename)
+        suffix = 1
+        while (filename in self.textureFileArray):
+            name = texture.name(self.namespace) + "." + str(suffix)
+            filename = base + "." + str(suffix) + extension
+            suffix += 1
+
+        self.textureArray[key] = {"name" : name, "filename" : filename}
+        self.textureFileArray.add(filename)
+
         directory = os.path.dirname(self.filepath)
         path = os.path.join(directory, filename)
 
-        # Write texture data to external file
-        with open(path, 'wb') as f:
-            f.write(texture.data())
+        # Write texture data to external file. With the texture cache, a file that is already
+        # up to date is left alone, and the encoded data is reused from an earlier export.
+        # Encoding reads pixels from Blender and stays on this thread, only the file writes are queued.
+        if (self.textureCache):
+            fingerprint = texture.fingerprint(self.pngEncoder)
+            if (not self.textureCache.Unchanged(path, fingerprint)):
+                data = self.textureCache.Load(fingerprint)
+                if (data is None):
+                    data = texture.data(self.pngEncoder)
+                    self.SubmitFileWrite(self.textureCache.Store, fingerprint, data)
+                self.SubmitFileWrite(ExportFilePool.WriteFile, path, data)
+                self.textureCache.Record(path, fingerprint, len(data))
+        else:
+            self.SubmitFileWrite(ExportFilePool.WriteFile, path, texture.data(self.pngEncoder))
 
-        # This function exports a single texture from a material.
         self.IndentWrite(B"texture: {\n")
         self.indentLevel += 1
 
         self.IndentWrite(B"name: ")
-        self.WriteFileName(texture.name(self.namespace))
+        self.WriteFileName(name)
         self.Write(B"\n")
 
         self.IndentWrite(B"path: ")
@@ -3051,6 +4444,9 @@ class OpenGexExporter(bpy.types.Operator, ExportHelper):
         self.indentLevel -= 1
         self.IndentWrite(B"}\n")
 
+        return (name)
+
+    @ProfiledSection
     def ExportMaterials(self):
         # This function exports all of the materials used in the scene.
         for materialRef in self.materialArray.items():
@@ -3091,18 +4487,19 @@ class OpenGexExporter(bpy.types.Operator, ExportHelper):
 
             # TODO(dlb): Export factors if textures don't exist? Or both? Mix? Something?
             # TODO(dlb): Pack channels during export?
+            textureName = {}
             if (alpha_texture):
-                self.ExportTexture(alpha_texture, B"alpha")
+                textureName[B"alpha"] = self.ExportTexture(alpha_texture, B"alpha")
             if (albedo_texture):
-                self.ExportTexture(albedo_texture, B"albedo")
+                textureName[B"albedo"] = self.ExportTexture(albedo_texture, B"albedo")
             if (emissive_texture):
-                self.ExportTexture(emissive_texture, B"emission")
+                textureName[B"emission"] = self.ExportTexture(emissive_texture, B"emission")
             if (metallic_texture):
-                self.ExportTexture(metallic_texture, B"metallic")
+                textureName[B"metallic"] = self.ExportTexture(metallic_texture, B"metallic")
             if (normal_texture):
-                self.ExportTexture(normal_texture, B"normal")
+                textureName[B"normal"] = self.ExportTexture(normal_texture, B"normal")
             if (roughness_texture):
-                self.ExportTexture(roughness_texture, B"roughness")
+                textureName[B"roughness"] = self.ExportTexture(roughness_texture, B"roughness")
 
             # TODO(dlb): Check that textures which are going to be channel-combined have the same resolution
             # def tex_resolution_match(sockets: typing.Tuple[bpy.types.NodeSocket]):
@@ -3134,7 +4531,7 @@ class OpenGexExporter(bpy.types.Operator, ExportHelper):
                 self.Write(B"\n")
             if (alpha_texture):
                 self.IndentWrite(B"alpha_texture: ")
-                self.WriteFileName(alpha_texture.name(self.namespace))
+                self.WriteFileName(textureName[B"alpha"])
                 self.Write(B"\n")
             if (albedo_factor):
                 self.IndentWrite(B"albedo_factor: ")
@@ -3142,7 +4539,7 @@ class OpenGexExporter(bpy.types.Operator, ExportHelper):
                 self.Write(B"\n")
             if (albedo_texture):
                 self.IndentWrite(B"albedo_texture: ")
-                self.WriteFileName(albedo_texture.name(self.namespace))
+                self.WriteFileName(textureName[B"albedo"])
                 self.Write(B"\n")
             if (emissive_factor):
                 self.IndentWrite(B"emissive_factor: ")
@@ -3150,7 +4547,7 @@ class OpenGexExporter(bpy.types.Operator, ExportHelper):
                 self.Write(B"\n")
             if (emissive_texture):
                 self.IndentWrite(B"emissive_texture: ")
-                self.WriteFileName(emissive_texture.name(self.namespace))
+                self.WriteFileName(textureName[B"emission"])
                 self.Write(B"\n")
             if (metallic_factor):
                 self.IndentWrite(B"metallic_factor: ")
@@ -3158,7 +4555,7 @@ class OpenGexExporter(bpy.types.Operator, ExportHelper):
                 self.Write(B"\n")
             if (metallic_texture):
                 self.IndentWrite(B"metallic_texture: ")
-                self.WriteFileName(metallic_texture.name(self.namespace))
+                self.WriteFileName(textureName[B"metallic"])
                 self.Write(B"\n")
             if (normal_factor):
                 self.IndentWrite(B"normal_factor: ")
@@ -3166,7 +4563,7 @@ class OpenGexExporter(bpy.types.Operator, ExportHelper):
                 self.Write(B"\n")
             if (normal_texture):
                 self.IndentWrite(B"normal_texture: ")
-                self.WriteFileName(normal_texture.name(self.namespace))
+                self.WriteFileName(textureName[B"normal"])
                 self.Write(B"\n")
             if (roughness_factor):
                 self.IndentWrite(B"roughness_factor: ")
@@ -3174,7 +4571,7 @@ class OpenGexExporter(bpy.types.Operator, ExportHelper):
                 self.Write(B"\n")
             if (roughness_texture):
                 self.IndentWrite(B"roughness_texture: ")
-                self.WriteFileName(roughness_texture.name(self.namespace))
+                self.WriteFileName(textureName[B"roughness"])
                 self.Write(B"\n")
 
             self.indentLevel -= 1
@@ -3225,55 +4622,122 @@ class OpenGexExporter(bpy.types.Operator, ExportHelper):
         print("# OpenGEX Exporter v0.0.0")
         print("#--------------------------------------------------")
 
-        self.namespace = bpy.path.basename(bpy.data.filepath).split('.', 1)[0] + '.'
-        self.file = open(self.filepath, "wb")
-
-        self.indentLevel = 0
-
-        scene = context.scene
-        self.ExportMetrics(scene)
-
-        originalFrame = scene.frame_current
-        originalSubframe = scene.frame_subframe
-        self.restoreFrame = False
-
-        self.beginFrame = scene.frame_start
-        self.endFrame = scene.frame_end
-        self.frameTime = 1.0 / (scene.render.fps_base * scene.render.fps)
-
-        self.nodeArray = {}
-        self.geometryArray = {}
-        self.lightArray = {}
-        self.cameraArray = {}
-        self.materialArray = {}
-        self.boneParentArray = {}
-
-        self.exportAllFlag = not self.option_export_selection
-        self.sampleAnimationFlag = self.option_sample_animation
-
-        self.Write(B"{\n")
-
-        print("Processing nodes")
-        for object in scene.objects:
-            if (not object.parent):
-                print(f"  {object.type} {object.name}")
-                self.ProcessNode(object)
-
-        self.ProcessSkinnedMeshes()
-
-        print("Exporting nodes")
-        for object in scene.objects:
-            if (not object.parent):
-                print(f"  {object.type} {object.name}")
-                self.ExportNode(object, scene)
-
-        print("Exporting objects")
-        self.ExportObjects(scene)
-        print("Exporting materials")
-        self.ExportMaterials()
+        self.profiler = ExportProfiler(self.option_profile_python)
+        self.writer = None
+        self.binaryFile = None
+        self.filePool = None
+        try:
+            self.namespace = bpy.path.basename(bpy.data.filepath).split('.', 1)[0] + '.'
+            self.writer = ExportWriter(open(self.filepath, "wb"), self.option_write_buffer_size << 10)
+            if (self.option_binary_arrays):
+                self.binaryFile = ExportBinaryFile(os.path.splitext(self.filepath)[0] + ".ogexb")
+
+            self.indentLevel = 0
+
+            scene = context.scene
+            self.ExportMetrics(scene)
+
+            originalFrame = scene.frame_current
+            originalSubframe = scene.frame_subframe
+            self.restoreFrame = False
+
+            self.beginFrame = scene.frame_start
+            self.endFrame = scene.frame_end
+            self.frameTime = 1.0 / (scene.render.fps_base * scene.render.fps)
+
+            self.nodeArray = {}
+            self.geometryArray = {}
+            self.lightArray = {}
+            self.cameraArray = {}
+            self.materialArray = {}
+            self.textureArray = {}
+            self.textureFileArray = set()
+            if (self.option_write_threads > 0):
+                self.filePool = ExportFilePool(self.option_write_threads, self.option_write_queue_size)
+            self.pngEncoder = PngEncoder(self.option_png_compression, self.option_png_filter)
+            self.textureCache = None
+            if (self.option_texture_cache):
+                self.textureCache = ExportTextureCache(os.path.join(os.path.dirname(self.filepath), kTextureCacheDirectory), os.path.splitext(os.path.basename(self.filepath))[0])
+            self.boneParentArray = {}
+            self.keyframeTables = {}
+
+            self.exportAllFlag = not self.option_export_selection
+            self.sampleAnimationFlag = self.option_sample_animation
+
+            self.Write(B"{\n")
+            if (self.binaryFile):
+                self.IndentWrite(B"binary_file: ")
+                self.WriteString(self.binaryFile.name)
+                self.Write(B"\n")
+            if (self.option_shared_timeline):
+                self.IndentWrite(B"timeline: {\n")
+                self.indentLevel += 1
+                self.IndentWrite(B"frame_count: ")
+                self.WriteInt(self.endFrame - self.beginFrame + 1)
+                self.Write(B"\n")
+                self.IndentWrite(B"frame_time: ")
+                self.WriteFloat(self.frameTime)
+                self.Write(B"\n")
+                self.indentLevel -= 1
+                self.IndentWrite(B"}\n")
 
-        self.Write(B"}\n")
-        self.file.close()
+            print("Processing nodes")
+            with self.profiler.Section("ProcessNodes"):
+                for object in scene.objects:
+                    if (not object.parent):
+                        print(f"  {object.type} {object.name}")
+                        self.ProcessNode(object)
+
+                self.ProcessSkinnedMeshes()
+
+            print("Sampling animation")
+            with self.profiler.Section("SampleAnimation"):
+                self.actionIndex = ActionIndex(bpy.data.actions)
+                self.animationSampler = AnimationSampler(self.option_direct_animation, self.option_isolate_sampling, self.option_animation_workers, self.actionIndex)
+                self.animationSampler.Sample(self, scene)
+
+            print("Exporting nodes")
+            with self.profiler.Section("ExportNodes"):
+                for object in scene.objects:
+                    if (not object.parent):
+                        print(f"  {object.type} {object.name}")
+                        self.ExportNode(object, scene)
+
+            print("Exporting objects")
+            self.ExportObjects(scene)
+            print("Exporting materials")
+            self.ExportMaterials()
+
+            self.Write(B"}\n")
+            self.writer.Close()
+            print(f"Wrote {self.writer.byteCount} bytes in {self.writer.flushCount} flushes")
+            if (self.binaryFile):
+                self.binaryFile.Close()
+                print(f"Wrote {self.binaryFile.offset} bytes to {self.binaryFile.name}")
+            if (self.filePool):
+                with self.profiler.Section("WaitForFileWrites"):
+                    self.filePool.Close()
+            if (self.textureCache):
+                self.textureCache.Close()
+        except BaseException:
+            # Stop the file writes of a failed export. The texture cache isn't closed, so its
+            # manifest never records a file that may not have been written.
+            if (self.filePool):
+                self.filePool.Cancel()
+            raise
+        finally:
+            # Don't leave cProfile attached to Blender or the output files open when the
+            # export fails. Both are no-ops after a successful export.
+            self.profiler.Stop()
+            if (self.writer):
+                self.writer.file.close()
+            if (self.binaryFile):
+                self.binaryFile.file.close()
+
+        reportBasePath = None
+        if ((self.option_profile_report) or (self.option_profile_python)):
+            reportBasePath = os.path.splitext(self.filepath)[0]
+        self.profiler.Finish(reportBasePath)
 
         if (self.restoreFrame):
             scene.frame_set(originalFrame, subframe=originalSubframe)
@@ -3309,16 +4773,28 @@ class Image:
         self.uri = uri
 
 class ImageData:
-    def __init__(self, data: bytes, mime_type: str, name: str):
-        self._data = data
+    """Encoded image file. The image is only encoded when its data is first
+    requested, so an image that turns out to be a duplicate of one that was
+    already exported is never encoded. Two ImageDatas are equal when they
+    are built from the same source images and channels in the same format.
+    """
+    def __init__(self, image: "ExportImage", mime_type: str, name: str):
+        self._image = image
+        self._data = None
         self._mime_type = mime_type
         self._name = name
 
     def __eq__(self, other):
-        return self._data == other.data
+        return self.key() == other.key()
 
     def __hash__(self):
-        return hash(self._data)
+        return hash(self.key())
+
+    def key(self):
+        return (self._mime_type, self._image.key())
+
+    def fingerprint(self, png_encoder: Optional["PngEncoder"] = None):
+        return self._image.fingerprint(self._mime_type, png_encoder)
 
     def adjusted_name(self):
         regex_dot = re.compile(".")
@@ -3326,9 +4802,14 @@ class ImageData:
         new_name = "".join([char for char in adjusted_name if char not in "!#$&'()*+,/:;<>?@[\\]^`{|}~"])
         return new_name
 
+    def encode(self, png_encoder: Optional["PngEncoder"] = None) -> bytes:
+        if self._data is None:
+            self._data = self._image.encode(self._mime_type, png_encoder)
+        return self._data
+
     @property
     def data(self):
-        return self._data
+        return self.encode()
 
     @property
     def name(self):
@@ -3342,7 +4823,7 @@ class ImageData:
 
     @property
     def byte_length(self):
-        return len(self._data)
+        return len(self.data)
 
 class Sampler:
     def __init__(self, mag_filter, min_filter, name, wrap_s, wrap_t):
@@ -3371,8 +4852,14 @@ class TextureInfo:
     def name(self, namespace):
         return namespace + 'texture.' + self.index.source.uri.name
 
-    def data(self):
-        return self.index.source.uri.data
+    def data(self, png_encoder=None):
+        return self.index.source.uri.encode(png_encoder)
+
+    def key(self):
+        return self.index.source.uri.key()
+
+    def fingerprint(self, png_encoder=None):
+        return self.index.source.uri.fingerprint(png_encoder)
 
 class Channel(enum.IntEnum):
     R = 0
@@ -3438,6 +4925,68 @@ class ExportImage:
     def empty(self) -> bool:
         return not self.fills
 
+    def key(self) -> tuple:
+        """Returns a hashable description of the image: the source image and
+        channel of every filled channel. ExportImages with equal keys encode
+        to the same bytes.
+        """
+        key = []
+        for dst_chan, fill in sorted(self.fills.items()):
+            if isinstance(fill, FillImage):
+                key.append((int(dst_chan), fill.image.as_pointer(), int(fill.src_chan)))
+            else:
+                key.append((int(dst_chan), None, None))
+        return tuple(key)
+
+    def persistent_key(self) -> tuple:
+        """Like key(), but identifies source images by their library and name
+        instead of their address, so it is the same in every Blender session.
+        """
+        key = []
+        for dst_chan, fill in sorted(self.fills.items()):
+            if isinstance(fill, FillImage):
+                key.append((int(dst_chan), _image_id(fill.image), int(fill.src_chan)))
+            else:
+                key.append((int(dst_chan), None, None))
+        return tuple(key)
+
+    def fingerprint(self, mime_type: Optional[str], png_encoder: Optional["PngEncoder"] = None) -> str:
+        """Returns a hash of everything the encoded image depends on: the
+        target format and PNG encoder settings, the fill map, and for each
+        source image its settings and contents. The contents of a saved image are identified by the
+        path, size, and modification time of its file, or by the packed data,
+        and those of a generated or modified image by its pixels.
+        """
+        sha = hashlib.sha1()
+        png_key = (png_encoder or PngEncoder()).key() if self.uses_png_encoder(mime_type) else None
+        sha.update(repr((mime_type, png_key, self.persistent_key())).encode("UTF-8"))
+
+        images = {}
+        for fill in self.fills.values():
+            if isinstance(fill, FillImage):
+                images[_image_id(fill.image)] = fill.image
+
+        for image_id, image in sorted(images.items()):
+            sha.update(repr((image_id, image.source, image.file_format, image.colorspace_settings.name,
+                    image.alpha_mode, tuple(image.size), image.channels, image.is_dirty)).encode("UTF-8"))
+
+            if image.source == 'FILE' and not image.is_dirty:
+                if image.packed_file is not None:
+                    sha.update(image.packed_file.data)
+                    continue
+
+                src_path = bpy.path.abspath(image.filepath_raw)
+                if os.path.isfile(src_path):
+                    stat = os.stat(src_path)
+                    sha.update(repr((src_path, stat.st_size, stat.st_mtime_ns)).encode("UTF-8"))
+                    continue
+
+            pixels = np.empty(image.size[0] * image.size[1] * image.channels, dtype=np.float32)
+            image.pixels.foreach_get(pixels)
+            sha.update(pixels.tobytes())
+
+        return sha.hexdigest()
+
     def blender_image(self) -> Optional[bpy.types.Image]:
         """If there's an existing Blender image we can use,
         returns it. Otherwise (if channels need packing),
@@ -3456,11 +5005,21 @@ class ExportImage:
             len(set(fill.image.name for fill in self.fills.values())) == 1
         )
 
-    def encode(self, mime_type: Optional[str]) -> bytes:
-        self.file_format = {
-            "image/jpeg": "JPEG",
-            "image/png": "PNG"
-        }.get(mime_type, "PNG")
+    def uses_png_encoder(self, mime_type: Optional[str]) -> bool:
+        """Returns whether encode() writes the image with a PngEncoder, and so
+        whether the encoder settings affect the result. Other images are
+        copied from their files or saved by Blender.
+        """
+        if _file_format(mime_type) != "PNG":
+            return False
+        if not self.__on_happy_path():
+            return True
+        image = self.blender_image()
+        return not _has_source_file(image, "PNG") and _has_byte_pixels(image)
+
+    def encode(self, mime_type: Optional[str], png_encoder: Optional["PngEncoder"] = None) -> bytes:
+        self.file_format = _file_format(mime_type)
+        self.png_encoder = png_encoder or PngEncoder()
 
         # Happy path = we can just use an existing Blender image
         if self.__on_happy_path():
@@ -3474,165 +5033,85 @@ class ExportImage:
 
     def __encode_unhappy(self) -> bytes:
         print_console("WARNING", "Taking unhappy path for ExportImage.encode().")
-        result = self.__encode_unhappy_with_compositor()
-        if result is not None:
-            return result
-        return None #self.__encode_unhappy_with_numpy()
-
-    def __encode_unhappy_with_compositor(self) -> bytes:
-        # Builds a Compositor graph that will build the correct image
-        # from the description in self.fills.
-        #
-        #     [ Image ]->[ Sep RGBA ]    [ Comb RGBA ]
-        #                [  src_chan]--->[dst_chan   ]--->[ Output ]
-        #
-        # This is hacky, but is about 4x faster than using
-        # __encode_unhappy_with_numpy. There are some caveats though:
-
-        # First, we can't handle pre-multiplied alpha.
-        if Channel.A in self.fills:
-            return None
-
-        # Second, in order to get the same results as using image.pixels
-        # (which ignores the colorspace), we need to use the 'Non-Color'
-        # colorspace for all images and set the output device to 'None'. But
-        # setting the colorspace on dirty images discards their changes.
-        # So we can't handle dirty images that aren't already 'Non-Color'.
-        for fill in self.fills:
+        return self.__encode_unhappy_with_numpy()
+
+    def __encode_unhappy_with_numpy(self) -> bytes:
+        return self.__encode_from_numpy_array(self.__gather_pixels(), Channel.A in self.fills)
+
+    def __gather_pixels(self) -> np.ndarray:
+        # Read the pixels of each source image once with foreach_get into a
+        # float32 buffer, and assemble the image described by self.fills with
+        # array slicing. Channels filled with FillWhite, channels that aren't
+        # filled, and source channels the image doesn't have (like the alpha
+        # of an RGB image) are all ones.
+        result = None
+
+        images = {}
+        for fill in self.fills.values():
             if isinstance(fill, FillImage):
-                if fill.image.is_dirty:
-                    if fill.image.colorspace_settings.name != 'Non-Color':
-                        return None
+                images[fill.image.name] = fill.image
+
+        for image_name, image in images.items():
+            width, height = image.size[:2]
+            if result is None:
+                result = np.ones((height, width, 4), np.float32)
+            # Images should all be the same size (should be guaranteed by
+            # gather_texture_info).
+            assert (height, width) == result.shape[:2], f"Image '{image_name}' does not match the size of the other channels"
+
+            pixels = np.empty(width * height * image.channels, np.float32)
+            image.pixels.foreach_get(pixels)
+            pixels = pixels.reshape((height, width, image.channels))
 
-        tmp_scene = None
-        orig_colorspaces = {}  # remembers original colorspaces
-        try:
-            tmp_scene = bpy.data.scenes.new('##gltf-export:tmp-scene##')
-            tmp_scene.use_nodes = True
-            node_tree = tmp_scene.node_tree
-            for node in node_tree.nodes:
-                node_tree.nodes.remove(node)
-
-            out = node_tree.nodes.new('CompositorNodeComposite')
-            comb_rgba = node_tree.nodes.new('CompositorNodeCombRGBA')
-            for i in range(4):
-                comb_rgba.inputs[i].default_value = 1.0
-            node_tree.links.new(out.inputs['Image'], comb_rgba.outputs['Image'])
-
-            img_size = None
             for dst_chan, fill in self.fills.items():
-                if not isinstance(fill, FillImage):
-                    continue
+                if isinstance(fill, FillImage) and fill.image.name == image_name:
+                    if fill.src_chan < image.channels:
+                        result[:, :, dst_chan] = pixels[:, :, fill.src_chan]
 
-                img = node_tree.nodes.new('CompositorNodeImage')
-                img.image = fill.image
-                sep_rgba = node_tree.nodes.new('CompositorNodeSepRGBA')
-                node_tree.links.new(sep_rgba.inputs['Image'], img.outputs['Image'])
-                node_tree.links.new(comb_rgba.inputs[dst_chan], sep_rgba.outputs[fill.src_chan])
+        if result is None:
+            # No ImageFills; use a 1x1 white pixel
+            result = np.ones((1, 1, 4), np.float32)
 
-                if fill.image.colorspace_settings.name != 'Non-Color':
-                    if fill.image.name not in orig_colorspaces:
-                        orig_colorspaces[fill.image.name] = \
-                            fill.image.colorspace_settings.name
-                    fill.image.colorspace_settings.name = 'Non-Color'
+        return result
 
-                if img_size is None:
-                    img_size = fill.image.size[:2]
-                else:
-                    # All images should be the same size (should be
-                    # guaranteed by gather_texture_info)
-                    assert img_size == fill.image.size[:2]
-
-            width, height = img_size or (1, 1)
-            return _render_temp_scene(
-                tmp_scene=tmp_scene,
-                width=width,
-                height=height,
-                file_format=self.file_format,
-                color_mode='RGB',
-                colorspace='None',
+    def __encode_from_numpy_array(self, array: np.ndarray, alpha: bool) -> bytes:
+        # PNGs are written in memory. Only JPEG still goes through a temporary
+        # Blender image that is saved to disk.
+        if self.file_format == "PNG":
+            return self.png_encoder.encode(array, alpha)
+
+        tmp_image = None
+        try:
+            tmp_image = bpy.data.images.new(
+                "##gltf-export:tmp-image##",
+                width=array.shape[1],
+                height=array.shape[0],
+                alpha=alpha,
             )
+            assert tmp_image.channels == 4  # 4 regardless of the alpha argument above.
+
+            tmp_image.pixels.foreach_set(array.ravel())
+
+            return _encode_temp_image(tmp_image, self.file_format)
 
         finally:
-            for img_name, colorspace in orig_colorspaces.items():
-                bpy.data.images[img_name].colorspace_settings.name = colorspace
-
-            if tmp_scene is not None:
-                bpy.data.scenes.remove(tmp_scene, do_unlink=True)
-
-    # def __encode_unhappy_with_numpy(self):
-    #     # Read the pixels of each image with image.pixels, put them into a
-    #     # numpy, and assemble the desired image that way. This is the slowest
-    #     # method, and the conversion to Python data eats a lot of memory, so
-    #     # it's only used as a last resort.
-    #     result = None
-
-    #     img_fills = {
-    #         chan: fill
-    #         for chan, fill in self.fills.items()
-    #         if isinstance(fill, FillImage)
-    #     }
-    #     # Loop over images instead of dst_chans; ensures we only decode each
-    #     # image once even if it's used in multiple channels.
-    #     image_names = list(set(fill.image.name for fill in img_fills.values()))
-    #     for image_name in image_names:
-    #         image = bpy.data.images[image_name]
-
-    #         if result is None:
-    #             result = np.ones((image.size[0], image.size[1], 4), np.float32)
-    #         # Images should all be the same size (should be guaranteed by
-    #         # gather_texture_info).
-    #         assert (image.size[0], image.size[1]) == result.shape[:2]
-
-    #         # Slow and eats all your memory.
-    #         pixels = np.array(image.pixels[:])
-
-    #         pixels = pixels.reshape((image.size[0], image.size[1], image.channels))
-
-    #         for dst_chan, img_fill in img_fills.items():
-    #             if img_fill.image == image:
-    #                 result[:, :, dst_chan] = pixels[:, :, img_fill.src_chan]
-
-    #         pixels = None  # GC this please
-
-    #     if result is None:
-    #         # No ImageFills; use a 1x1 white pixel
-    #         result = np.array([1.0, 1.0, 1.0, 1.0])
-    #         result = result.reshape((1, 1, 4))
-
-    #     return self.__encode_from_numpy_array(result)
-
-    # def __encode_from_numpy_array(self, array: np.ndarray) -> bytes:
-    #     tmp_image = None
-    #     try:
-    #         tmp_image = bpy.data.images.new(
-    #             "##gltf-export:tmp-image##",
-    #             width=array.shape[0],
-    #             height=array.shape[1],
-    #             alpha=Channel.A in self.fills,
-    #         )
-    #         assert tmp_image.channels == 4  # 4 regardless of the alpha argument above.
-
-    #         # Also slow and eats all your memory.
-    #         tmp_image.pixels = array.flatten().tolist()
-
-    #         return _encode_temp_image(tmp_image, self.file_format)
-
-    #     finally:
-    #         if tmp_image is not None:
-    #             bpy.data.images.remove(tmp_image, do_unlink=True)
+            if tmp_image is not None:
+                bpy.data.images.remove(tmp_image, do_unlink=True)
 
     def __encode_from_image(self, image: bpy.types.Image) -> bytes:
         # See if there is an existing file we can use.
-        if image.source == 'FILE' and image.file_format == self.file_format and \
-                not image.is_dirty:
+        if _has_source_file(image, self.file_format):
             if image.packed_file is not None:
                 return image.packed_file.data
             else:
-                src_path = bpy.path.abspath(image.filepath_raw)
-                if os.path.isfile(src_path):
-                    with open(src_path, 'rb') as f:
-                        return f.read()
+                with open(bpy.path.abspath(image.filepath_raw), 'rb') as f:
+                    return f.read()
+
+        # The pixels of a byte image are its stored 8-bit values, so they can
+        # be written to a PNG without going through Blender. Float images are
+        # left to Blender, which converts them to the display color space.
+        if self.file_format == "PNG" and _has_byte_pixels(image):
+            return self.__encode_from_numpy_array(self.__gather_pixels(), image.depth == 32)
 
         # Copy to a temp image and save.
         tmp_image = None
@@ -3640,13 +5119,37 @@ class ExportImage:
             tmp_image = image.copy()
             tmp_image.update()
             if image.is_dirty:
-                tmp_image.pixels = image.pixels[:]
+                pixels = np.empty(len(image.pixels), np.float32)
+                image.pixels.foreach_get(pixels)
+                tmp_image.pixels.foreach_set(pixels)
 
             return _encode_temp_image(tmp_image, self.file_format)
         finally:
             if tmp_image is not None:
                 bpy.data.images.remove(tmp_image, do_unlink=True)
 
+def _file_format(mime_type: Optional[str]) -> str:
+    return {
+        "image/jpeg": "JPEG",
+        "image/png": "PNG"
+    }.get(mime_type, "PNG")
+
+def _has_source_file(image: bpy.types.Image, file_format: str) -> bool:
+    # Whether the image's packed data or file can be used as it is.
+    if image.source != 'FILE' or image.file_format != file_format or image.is_dirty:
+        return False
+    return image.packed_file is not None or os.path.isfile(bpy.path.abspath(image.filepath_raw))
+
+def _has_byte_pixels(image: bpy.types.Image) -> bool:
+    # Whether PngEncoder can write the image's pixels as they are.
+    return not image.is_float and image.channels >= 3
+
+def _image_id(image: bpy.types.Image) -> tuple:
+    # The path of the library an image is linked from, and its name. Unlike
+    # as_pointer(), this stays the same when the .blend file is reopened.
+    library = image.library.filepath if image.library is not None else ""
+    return (library, image.name)
+
 def _encode_temp_image(tmp_image: bpy.types.Image, file_format: str) -> bytes:
     with tempfile.TemporaryDirectory() as tmpdirname:
         tmpfilename = tmpdirname + '/img'
@@ -3659,42 +5162,115 @@ def _encode_temp_image(tmp_image: bpy.types.Image, file_format: str) -> bytes:
         with open(tmpfilename, "rb") as f:
             return f.read()
 
-def _render_temp_scene(
-    tmp_scene: bpy.types.Scene,
-    width: int,
-    height: int,
-    file_format: str,
-    color_mode: str,
-    colorspace: str,
-) -> bytes:
-    """Set render settings, render to a file, and read back."""
-    tmp_scene.render.resolution_x = width
-    tmp_scene.render.resolution_y = height
-    tmp_scene.render.resolution_percentage = 100
-    tmp_scene.display_settings.display_device = colorspace
-    tmp_scene.render.image_settings.color_mode = color_mode
-    tmp_scene.render.dither_intensity = 0.0
-
-    # Turn off all metadata (stuff like use_stamp_date, etc.)
-    for attr in dir(tmp_scene.render):
-        if attr.startswith('use_stamp_'):
-            setattr(tmp_scene.render, attr, False)
+class PngEncoder:
+    """Writes 8-bit RGB or RGBA PNG files in memory from the float pixel
+    buffers that Blender images hold, without saving a temporary image.
 
-    with tempfile.TemporaryDirectory() as tmpdirname:
-        tmpfilename = tmpdirname + "/img"
-        tmp_scene.render.filepath = tmpfilename
-        tmp_scene.render.use_file_extension = False
-        tmp_scene.render.image_settings.file_format = file_format
+    Rows are filtered with NumPy and compressed with zlib. The filter is
+    either the same for every row, or chosen for each row by the heuristic
+    libpng uses: the filter whose output has the smallest sum of absolute
+    values, read as signed bytes.
+    """
 
-        bpy.ops.render.render(scene=tmp_scene.name, write_still=True)
+    FILTERS = ("NONE", "SUB", "UP", "AVERAGE", "PAETH")
 
-        with open(tmpfilename, "rb") as f:
-            return f.read()
+    # Rows are filtered and compressed in blocks of about this many bytes,
+    # which bounds the memory used by the filter candidates.
+    BLOCK_SIZE = 1 << 22
 
+    def __init__(self, compression_level: int = 6, filter_strategy: str = "ADAPTIVE"):
+        self.compression_level = compression_level
+        self.filter_strategy = filter_strategy
 
+    def key(self) -> tuple:
+        return (self.compression_level, self.filter_strategy)
 
+    def encode(self, array: np.ndarray, alpha: bool) -> bytes:
+        """Encodes a (height, width, 4) array of pixels, with the bottom row
+        first like Blender stores them. The alpha channel is only written
+        if alpha is set.
+        """
+        height, width = array.shape[:2]
+        channels = 4 if alpha else 3
+
+        # Round the same way Blender does when it converts floats to bytes.
+        rows = (np.clip(array[::-1, :, :channels], 0.0, 1.0) * 255.0 + 0.5).astype(np.uint8)
+        rows = rows.reshape((height, width * channels))
+
+        strategy = zlib.Z_DEFAULT_STRATEGY if self.filter_strategy == "NONE" else zlib.Z_FILTERED
+        compressor = zlib.compressobj(self.compression_level, zlib.DEFLATED, zlib.MAX_WBITS, zlib.DEF_MEM_LEVEL, strategy)
+
+        idat = []
+        block_rows = max(1, PngEncoder.BLOCK_SIZE // max(rows.shape[1], 1))
+        prior = np.zeros(rows.shape[1], np.uint8)
+        for start in range(0, height, block_rows):
+            block = rows[start:start + block_rows]
+            idat.append(compressor.compress(self.__filter_rows(block, prior, channels).tobytes()))
+            prior = block[-1]
+        idat.append(compressor.flush())
+
+        header = struct.pack(">IIBBBBB", width, height, 8, 6 if alpha else 2, 0, 0, 0)
+        return b"".join((
+            b"\x89PNG\r\n\x1a\n",
+            _png_chunk(b"IHDR", header),
+            _png_chunk(b"IDAT", b"".join(idat)),
+            _png_chunk(b"IEND", b""),
+        ))
+
+    def __filter_rows(self, rows: np.ndarray, prior: np.ndarray, bpp: int) -> np.ndarray:
+        # Returns the rows with each one prefixed by its filter type byte.
+        # All filters predict from the unfiltered bytes to the left (a),
+        # above (b), and above and to the left (c).
+        x = rows.astype(np.int16)
+        b = np.empty_like(x)
+        b[0] = prior
+        b[1:] = x[:-1]
+        a = np.zeros_like(x)
+        a[:, bpp:] = x[:, :-bpp]
+        c = np.zeros_like(x)
+        c[:, bpp:] = b[:, :-bpp]
+
+        def residual(filter_type):
+            if filter_type == 0:
+                prediction = 0
+            elif filter_type == 1:
+                prediction = a
+            elif filter_type == 2:
+                prediction = b
+            elif filter_type == 3:
+                prediction = (a + b) >> 1
+            else:
+                pa = np.abs(b - c)
+                pb = np.abs(a - c)
+                pc = np.abs(a + b - 2 * c)
+                prediction = np.where((pa <= pb) & (pa <= pc), a, np.where(pb <= pc, b, c))
+            return ((x - prediction) & 0xFF).astype(np.uint8)
+
+        result = np.empty((rows.shape[0], rows.shape[1] + 1), np.uint8)
+        if self.filter_strategy in PngEncoder.FILTERS:
+            filter_type = PngEncoder.FILTERS.index(self.filter_strategy)
+            result[:, 0] = filter_type
+            result[:, 1:] = residual(filter_type)
+            return result
 
+        best_cost = None
+        for filter_type in range(len(PngEncoder.FILTERS)):
+            filtered = residual(filter_type)
+            cost = np.abs(filtered.view(np.int8).astype(np.int32)).sum(axis=1)
+            if best_cost is None:
+                best_cost = cost
+                result[:, 0] = filter_type
+                result[:, 1:] = filtered
+            else:
+                better = cost < best_cost
+                best_cost = np.where(better, cost, best_cost)
+                result[better, 0] = filter_type
+                result[better, 1:] = filtered[better]
+        return result
 
+def _png_chunk(chunk_type: bytes, data: bytes) -> bytes:
+    crc = zlib.crc32(data, zlib.crc32(chunk_type)) & 0xFFFFFFFF
+    return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", crc)
 
 def print_console(level, output):
     current_time = time.gmtime()
@@ -4104,7 +5680,7 @@ def gather_image_uri(image_data, mime_type, name):
     if True:
         # as usual we just store the data in place instead of already resolving the references
         return ImageData(
-            data=image_data.encode(mime_type=mime_type),
+            image=image_data,
             mime_type=mime_type,
             name=name
         )